@@ -0,0 +1,118 @@
+"""Minimal aria2c JSON-RPC client with a lazily started background daemon."""
+
+import os
+import secrets
+import subprocess
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson as _json  # optional: faster parsing of the once-per-second status polls
+except ImportError:
+    import json as _json
+
+from .config import ARIA2_RPC_PORT
+from .shell_utils import check_command_exists
+
+_RPC_URL = f"http://127.0.0.1:{ARIA2_RPC_PORT}/jsonrpc"
+_RPC_SECRET = secrets.token_hex(16)
+
+_daemon: Optional[subprocess.Popen] = None
+_daemon_lock = threading.Lock()
+
+
+def _post(method: str, params: List[Any], timeout: float = 5) -> Any:
+    payload = {"jsonrpc": "2.0", "id": "vdc", "method": method, "params": params}
+    body = _json.dumps(payload)
+    req = urllib.request.Request(
+        _RPC_URL,
+        data=body if isinstance(body, bytes) else body.encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        data = _json.loads(resp.read())
+    if "error" in data:
+        raise RuntimeError(data["error"].get("message", "aria2 RPC error"))
+    return data["result"]
+
+
+def aria2_call(method: str, *params: Any, timeout: float = 5) -> Any:
+    """Call a single aria2 RPC method, authenticating with the daemon secret."""
+    return _post(method, [f"token:{_RPC_SECRET}", *params], timeout=timeout)
+
+
+def aria2_multicall(calls: List[tuple], timeout: float = 5) -> List[Any]:
+    """Batch several (method, *params) calls into one HTTP round-trip.
+
+    Each result is either the method's return value or a dict with
+    ``faultCode``/``faultString`` when that individual call failed.
+    """
+    methods = [
+        {"methodName": method, "params": [f"token:{_RPC_SECRET}", *params]}
+        for method, *params in calls
+    ]
+    results = _post("system.multicall", [methods], timeout=timeout)
+    return [r[0] if isinstance(r, list) else r for r in results]
+
+
+def ensure_aria2_daemon() -> bool:
+    """Start the aria2c RPC daemon if needed; return True once it answers."""
+    global _daemon
+    with _daemon_lock:
+        if _daemon is not None and _daemon.poll() is None:
+            return True
+        if not check_command_exists("aria2c"):
+            return False
+        try:
+            _daemon = subprocess.Popen(
+                [
+                    "aria2c",
+                    "--enable-rpc",
+                    "--rpc-listen-all=false",
+                    f"--rpc-listen-port={ARIA2_RPC_PORT}",
+                    f"--rpc-secret={_RPC_SECRET}",
+                    f"--stop-with-process={os.getpid()}",
+                    "--continue=true",
+                    "--auto-file-renaming=false",
+                    "--file-allocation=falloc",
+                    # Shared by torrents and direct links; each batch caps its own concurrency
+                    "--max-concurrent-downloads=64",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except Exception:
+            _daemon = None
+            return False
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            try:
+                aria2_call("aria2.getVersion", timeout=1)
+                return True
+            except Exception:
+                if _daemon.poll() is not None:
+                    # Exited early, most likely because the RPC port is taken
+                    _daemon = None
+                    return False
+                time.sleep(0.1)
+        return False
+
+
+def add_uri(uri: str, options: Optional[Dict[str, str]] = None) -> str:
+    """Queue a download on the daemon and return its GID."""
+    return aria2_call("aria2.addUri", [uri], options or {})
+
+
+def tell_status_many(gids: List[str], keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Fetch status dicts for several GIDs in a single request."""
+    calls = [("aria2.tellStatus", gid, keys) if keys else ("aria2.tellStatus", gid) for gid in gids]
+    statuses = []
+    for result in aria2_multicall(calls):
+        if isinstance(result, dict) and "faultCode" in result:
+            statuses.append({"status": "error", "errorMessage": result.get("faultString", "")})
+        else:
+            statuses.append(result)
+    return statuses
@@ -9,3 +9,4 @@ YOUTUBE_DOMAINS = ("youtube.com", "youtu.be")
 TORRENT_EXTENSIONS = (".torrent",)
 MAGNET_PREFIX = "magnet:?"
 MAX_CONCURRENT_DOWNLOADS = 4
+ARIA2_RPC_PORT = 6800
@@ -1,22 +1,15 @@
 """Run dependency check at import time; show installation instructions and stop if deps missing."""
 
+import importlib.util
 import platform
 
 import streamlit as st
 
-missing_deps = []
-try:
-    import librosa
-except ImportError:
-    missing_deps.append("librosa")
-try:
-    from scipy.spatial.distance import cosine
-except ImportError:
-    missing_deps.append("scipy")
-try:
-    import distro
-except ImportError:
-    missing_deps.append("distro")
+# Probe with find_spec so the heavy packages are not actually imported at startup
+missing_deps = [
+    name for name in ("librosa", "scipy", "distro")
+    if importlib.util.find_spec(name) is None
+]
 
 if missing_deps:
     st.error("🚨 **Missing Required Dependencies**")
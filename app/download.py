@@ -1,175 +1,232 @@
 """Fetch, download, and stream video/audio files."""
 
 import asyncio
+import atexit
+import collections
 import concurrent.futures
-import json
 import os
-import re
+import shutil
 import subprocess
 import sys
 import tempfile
 import threading
 import time
 import urllib.parse
-import urllib.request
-from pathlib import Path
 
-import aiohttp
 import streamlit as st
-import yt_dlp
-from bs4 import BeautifulSoup, Tag
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
 
+from .aria2_rpc import add_uri, aria2_multicall, ensure_aria2_daemon, tell_status_many
 from .config import AUDIO_EXTENSIONS, VIDEO_EXTENSIONS
-from .path_utils import is_youtube_url, normalize_filename
+from .path_utils import file_uri, is_youtube_url, normalize_filename
 from .shell_utils import (
     TerminalOutput,
     check_command_exists,
-    run_shell_command,
+    ensure_terminal,
+    run_in_background,
     run_shell_command_with_output,
+    stream_command_to_terminal,
 )
-from .torrent import is_torrent_link
 
+ARIA2_STATUS_KEYS = ["status", "totalLength", "completedLength", "downloadSpeed", "errorMessage"]
 
-async def fetch_youtube_video_links(url, audio_only=False, playlist_limit=None):
-    """Fetch YouTube video links using yt-dlp."""
-    cache_key = f"{url}_{audio_only}_{playlist_limit}"
-    if hasattr(st.session_state, "youtube_cache") and cache_key in st.session_state.youtube_cache:
-        return st.session_state.youtube_cache[cache_key]
-
-    cmd_parts = ["yt-dlp", "--flat-playlist", "--dump-json"]
-    if audio_only:
-        cmd_parts.extend(["--extract-audio", "--audio-format", "mp3"])
+_VIDEO_EXT_SET = frozenset(e.lstrip(".") for e in VIDEO_EXTENSIONS)
+_AUDIO_EXT_SET = frozenset(e.lstrip(".") for e in AUDIO_EXTENSIONS)
+
+
+class FileStatus:
+    """Per-file download state; one instance per file, mutated in place by the workers."""
+
+    __slots__ = ("status", "progress", "downloaded", "speed", "eta", "elapsed")
+
+    def __init__(self, status: str = "pending", progress: int = 0) -> None:
+        self.status = status
+        self.progress = progress
+        self.downloaded = 0
+        self.speed = 0.0
+        self.eta = 0.0
+        self.elapsed = 0.0
+
+    def update_progress(self, progress, downloaded, speed, eta, elapsed) -> None:
+        self.progress = progress
+        self.downloaded = downloaded
+        self.speed = speed
+        self.eta = eta
+        self.elapsed = elapsed
+
+
+class StatusBoard(dict):
+    """file name -> FileStatus; ``changed`` is set whenever a worker records new state."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.changed = threading.Event()
+
+
+def _notify(status_dict):
+    changed = getattr(status_dict, "changed", None)
+    if changed is not None:
+        changed.set()
+
+
+def set_file_status(status_dict, file_key, status, progress=0):
+    """Set a file's status/progress, reusing its FileStatus when one exists; returns it."""
+    fs = status_dict.get(file_key)
+    if fs is None:
+        fs = status_dict[file_key] = FileStatus(status, progress)
+    else:
+        fs.status = status
+        fs.progress = progress
+    _notify(status_dict)
+    return fs
+
+
+def _extension(name):
+    """Lower-cased extension without the dot, or "" when there is none."""
+    _head, dot, ext = name.rpartition(".")
+    return ext.lower() if dot else ""
+
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def _extract_playlist(url, audio_only=False, playlist_limit=None):
+    """Extract flat playlist entries with yt-dlp; cached across sessions and reruns."""
+    ydl_opts = {
+        "quiet": True,
+        "extract_flat": "in_playlist",
+        "skip_download": True,
+    }
     if playlist_limit:
-        cmd_parts.extend(["--playlist-end", str(playlist_limit)])
-    cmd_parts.append(url)
-    result = run_shell_command(" ".join(cmd_parts), timeout=60)
+        ydl_opts["playlistend"] = playlist_limit
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    files = []
+    playlist_title = info.get("title") or "YouTube_Playlist"
+    for data in info.get("entries") or [info]:
+        if not data:
+            continue
+        title = data.get("title", "Unknown")
+        webpage_url = data.get("webpage_url", data.get("url", ""))
+        artist = data.get("uploader", "")
+        base_name = f"{artist} - {title}" if artist else title
+        safe_name = normalize_filename(base_name)
+        files.append({
+            "name": safe_name + (".mp3" if audio_only else ".mp4"),
+            "url": webpage_url,
+            "yt_webpage_url": webpage_url,
+            "is_youtube": True,
+            "is_audio": audio_only,
+            "needs_url_extraction": True,
+            "thumbnail_url": data.get("thumbnail"),
+            "video_id": data.get("id"),
+            # Full extractions report the chosen format's size; flat playlist entries usually don't
+            "filesize": data.get("filesize") or data.get("filesize_approx") or 0,
+            "artist": artist,
+            "title": title,
+        })
+    return files, playlist_title
 
-    if not result["success"]:
-        st.error(f"Failed to fetch YouTube links: {result['stderr']}")
-        return [], None
 
-    try:
-        lines = result["stdout"].strip().split("\n")
-        files = []
-        playlist_title = "YouTube_Playlist"
-        for line in lines:
-            if line.strip():
-                try:
-                    data = json.loads(line)
-                    title = data.get("title", "Unknown")
-                    webpage_url = data.get("webpage_url", data.get("url", ""))
-                    artist = data.get("uploader", "")
-                    base_name = f"{artist} - {title}" if artist else title
-                    safe_name = normalize_filename(base_name)
-                    files.append({
-                        "name": safe_name + (".mp3" if audio_only else ".mp4"),
-                        "url": webpage_url,
-                        "yt_webpage_url": webpage_url,
-                        "is_youtube": True,
-                        "is_audio": audio_only,
-                        "needs_url_extraction": True,
-                        "thumbnail_url": data.get("thumbnail"),
-                        "video_id": data.get("id"),
-                        "artist": artist,
-                        "title": title,
-                    })
-                    if not playlist_title or playlist_title == "YouTube_Playlist":
-                        playlist_title = data.get("playlist_title", data.get("title", "YouTube_Playlist"))
-                except json.JSONDecodeError:
-                    continue
-        if not hasattr(st.session_state, "youtube_cache"):
-            st.session_state.youtube_cache = {}
-        st.session_state.youtube_cache[cache_key] = (files, playlist_title)
-        return files, playlist_title
-    except Exception as e:
-        st.error(f"Error parsing YouTube data: {e}")
-        return [], None
+async def fetch_youtube_video_links(url, audio_only=False, playlist_limit=None):
+    """Fetch YouTube video links using the in-process yt-dlp API."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, _extract_playlist, url, audio_only, playlist_limit)
+
+
+_session_cache = {}
+
+
+def _get_session():
+    """Return a pooled aiohttp session for the running loop so repeat fetches reuse connections."""
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    # Sessions are bound to their loop; forget ones whose loop has been closed
+    for key, (cached_loop, _session) in list(_session_cache.items()):
+        if cached_loop.is_closed():
+            del _session_cache[key]
+    entry = _session_cache.get(id(loop))
+    if entry is None or entry[1].closed:
+        session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+        )
+        entry = (loop, session)
+        _session_cache[id(loop)] = entry
+    return entry[1]
+
+
+@atexit.register
+def _close_sessions():
+    for loop, session in _session_cache.values():
+        if not session.closed and not loop.is_closed() and not loop.is_running():
+            try:
+                loop.run_until_complete(session.close())
+            except Exception:
+                pass
 
 
 async def fetch_video_links(url, audio_only=False, playlist_limit=None):
     """Fetch video links from URL."""
     if is_youtube_url(url):
         return await fetch_youtube_video_links(url, audio_only, playlist_limit)
-    if url.lower().endswith(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS):
+    url_ext = _extension(url)
+    if url_ext in _VIDEO_EXT_SET or url_ext in _AUDIO_EXT_SET:
         filename = os.path.basename(url)
         return [{
             "name": filename,
             "url": url,
-            "is_audio": audio_only and url.lower().endswith(AUDIO_EXTENSIONS),
+            "is_audio": audio_only and url_ext in _AUDIO_EXT_SET,
         }], None
-    timeout = aiohttp.ClientTimeout(total=30)
+    from lxml import etree
+
     if not url.endswith("/"):
         url = url + "/"
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url) as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-            links = soup.find_all("a")
-            files = []
-            for link in links:
-                if isinstance(link, Tag):
-                    href = link.get("href")
-                    if href and isinstance(href, str):
-                        if audio_only:
-                            if href.lower().endswith(AUDIO_EXTENSIONS):
-                                name = os.path.basename(href)
-                                files.append({"name": name, "url": urllib.parse.urljoin(url, href), "is_audio": True})
-                        else:
-                            if href.lower().endswith(VIDEO_EXTENSIONS):
-                                name = os.path.basename(href)
-                                files.append({"name": name, "url": urllib.parse.urljoin(url, href), "is_audio": False})
-            return files, None
-
-
-def download_file_with_shell(file_url, file_path, file_info=None, progress_callback=None):
-    """Download file using shell commands (wget, curl, or yt-dlp) with progress tracking."""
-    file_dir = os.path.dirname(file_path)
-    os.makedirs(file_dir, exist_ok=True)
-    if file_info and file_info.get("is_youtube"):
-        if file_info.get("is_audio"):
-            cmd = f"yt-dlp --progress -x --audio-format mp3 -o '{file_path}' '{file_info['yt_webpage_url']}'"
-        else:
-            cmd = f"yt-dlp --progress -f 'best[ext=mp4]/best' -o '{file_path}' '{file_info['yt_webpage_url']}'"
+    ext_set = _AUDIO_EXT_SET if audio_only else _VIDEO_EXT_SET
+    files = []
+    # Stream-parse the index page: <a> elements are handled as chunks arrive and freed immediately
+    parser = etree.HTMLPullParser(events=("end",), tag="a")
+
+    def collect_links():
+        for _event, el in parser.read_events():
+            href = el.get("href")
+            if href and _extension(href) in ext_set:
+                name = os.path.basename(href)
+                files.append({"name": name, "url": urllib.parse.urljoin(url, href), "is_audio": audio_only})
+            el.clear()
+
+    session = _get_session()
+    async with session.get(url) as response:
+        async for chunk in response.content.iter_chunked(65536):
+            parser.feed(chunk)
+            collect_links()
+    parser.close()
+    collect_links()
+    return files, None
+
+
+def download_youtube_entry(file_path, file_info, terminal, stop_event):
+    """Download a YouTube entry with yt-dlp (aria2c as its downloader when available).
+
+    Direct links never come through here; they are queued on the aria2 RPC daemon,
+    or fetched with aiohttp when the daemon is unavailable.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    cmd = ["yt-dlp", "--progress"]
+    if check_command_exists("aria2c"):
+        cmd += ["--downloader", "aria2c", "--downloader-args", "aria2c:-x16 -s16 -k1M"]
+    if file_info.get("is_audio"):
+        cmd += ["-x", "--audio-format", "mp3"]
     else:
-        if check_command_exists("wget"):
-            cmd = f"wget --progress=bar:force -O '{file_path}' '{file_url}'"
-        elif check_command_exists("curl"):
-            cmd = f"curl -L --progress-bar -o '{file_path}' '{file_url}'"
-        else:
-            return False, "Neither wget nor curl available"
-    result = run_shell_command_with_output(cmd, timeout=600, show_in_terminal=True)
+        cmd += ["-f", "best[ext=mp4]/best"]
+    cmd += ["-o", file_path, file_info["yt_webpage_url"]]
+    result = run_shell_command_with_output(cmd, timeout=600, show_in_terminal=True, terminal=terminal, stop_event=stop_event)
     return result["success"], result["stderr"]
 
 
-def start_torrent_download_with_aria2(torrent_url: str, download_dir: str) -> bool:
-    """Start a torrent download using aria2c in a background thread."""
-    os.makedirs(download_dir, exist_ok=True)
-    if "terminal_output" not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    terminal = st.session_state.terminal_output
-    if not check_command_exists("aria2c"):
-        terminal.add_line("aria2c is not installed; cannot start torrent download.", "error")
-        return False
-    url = torrent_url.strip()
-    if not is_torrent_link(url):
-        terminal.add_line("The provided link does not look like a torrent or magnet link.", "error")
-        return False
-    parent_pid = os.getpid()
-    cmd = f"aria2c --seed-time=0 --stop-with-process={parent_pid} --dir='{download_dir}' '{url}'"
-
-    def _run():
-        terminal.add_line(f"Starting aria2c torrent download into {download_dir}", "info")
-        result = run_shell_command_with_output(cmd, timeout=86400, show_in_terminal=True)
-        if result["success"]:
-            terminal.add_line("✅ Torrent download completed.", "success")
-        else:
-            terminal.add_line(f"❌ Torrent download exited with code {result['returncode']}", "error")
-
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
-    return True
-
-
 def stream_torrent_via_webtorrent(torrent_ref: str) -> bool:
     """Stream a torrent directly to VLC using webtorrent-cli."""
     if "terminal_output" not in st.session_state:
@@ -186,165 +243,391 @@ def stream_torrent_via_webtorrent(torrent_ref: str) -> bool:
     if not ref:
         terminal.add_line("No torrent reference provided for streaming.", "error")
         return False
-    cmd = f'webtorrent "{ref}" --vlc'
+    cmd = ["webtorrent", ref, "--vlc"]
 
-    def _run():
+    async def _run():
         terminal.add_line("Starting webtorrent streaming to VLC...", "info")
-        result = run_shell_command_with_output(cmd, timeout=86400, show_in_terminal=True)
-        if result.get("returncode") not in (0, None):
-            terminal.add_line(f"webtorrent exited with code {result.get('returncode')}", "warning")
+        returncode = await stream_command_to_terminal(cmd, terminal, timeout=86400)
+        if returncode != 0:
+            terminal.add_line(f"webtorrent exited with code {returncode}", "warning")
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    run_in_background(_run())
     return True
 
 
-def _get_remote_file_size(url):
-    """Try HEAD first; if missing, try Range GET to read Content-Range total."""
-    try:
-        class HeadRequest(urllib.request.Request):
-            def get_method(self):
-                return "HEAD"
-        req = HeadRequest(url, headers={"User-Agent": "Mozilla/5.0"})
+async def _download_http_file(session, file, file_path, sem, status_dict, stop_event):
+    """Stream one direct link to disk, reporting progress straight from the socket reads."""
+    file_key = file["name"]
+    part_path = file_path + ".part"
+    async with sem:
+        if stop_event.is_set():
+            set_file_status(status_dict, file_key, "stopped")
+            return
+        fs = set_file_status(status_dict, file_key, "downloading")
+        start_time = time.time()
         try:
-            with urllib.request.urlopen(req, timeout=15) as resp:
-                length = resp.headers.get("Content-Length") or resp.headers.get("content-length")
-                if length and str(length).isdigit():
-                    return int(length)
-        except Exception:
-            pass
-        get_req = urllib.request.Request(
-            url,
-            headers={"User-Agent": "Mozilla/5.0", "Range": "bytes=0-0"},
-        )
-        with urllib.request.urlopen(get_req, timeout=15) as resp2:
-            cr = resp2.headers.get("Content-Range") or resp2.headers.get("content-range")
-            if cr:
-                m = re.search(r"/\s*(\d+)\s*$", cr)
-                if m:
-                    return int(m.group(1))
-        return 0
-    except Exception:
-        return 0
-
-
-def download_all_files(files, selected, download_dir, status_dict):
-    """Download all selected files using shell commands with concurrency control."""
+            async with session.get(file["url"]) as resp:
+                resp.raise_for_status()
+                total = resp.content_length or 0
+                done = 0
+                last_done = 0
+                last_update_time = start_time
+                avg_speed = 0.0
+                with open(part_path, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(1 << 20):
+                        if stop_event.is_set():
+                            fs.status = "stopped"
+                            _notify(status_dict)
+                            return
+                        f.write(chunk)
+                        done += len(chunk)
+                        current_time = time.time()
+                        time_diff = current_time - last_update_time
+                        if time_diff >= 0.5:
+                            instant_speed = (done - last_done) / time_diff
+                            avg_speed = instant_speed if avg_speed == 0 else 0.8 * avg_speed + 0.2 * instant_speed
+                            progress = max(0, min(int(done * 100 / total), 99)) if total else 0
+                            eta = (total - done) / avg_speed if total and avg_speed > 0 else 0
+                            fs.update_progress(progress, done, avg_speed, eta, current_time - start_time)
+                            _notify(status_dict)
+                            last_done = done
+                            last_update_time = current_time
+            os.replace(part_path, file_path)
+            set_file_status(status_dict, file_key, "completed", 100)
+        except Exception as e:
+            set_file_status(status_dict, file_key, f"error: {e}")
+
+
+async def _download_http_files(files, download_dir, max_workers, status_dict, stop_event):
+    """Download direct links on one event loop: N sockets, bounded by a semaphore, no helper processes."""
+    import aiohttp
+
+    sem = asyncio.Semaphore(max_workers)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=120)
+    async with aiohttp.ClientSession(timeout=timeout, headers={"User-Agent": "Mozilla/5.0"}) as session:
+        await asyncio.gather(*(
+            _download_http_file(session, file, os.path.join(download_dir, normalize_filename(file["name"])), sem, status_dict, stop_event)
+            for file in files
+        ))
+
+
+_observer = None
+_observer_lock = threading.Lock()
+
+
+def _get_observer():
+    """Return the shared filesystem observer (inotify/FSEvents), starting it on first use."""
+    global _observer
+    with _observer_lock:
+        if _observer is None:
+            _observer = Observer()
+            _observer.daemon = True
+            _observer.start()
+        return _observer
+
+
+class _ProgressEventHandler(FileSystemEventHandler):
+    """Turn write events on partial download files into speed/ETA updates."""
+
+    def __init__(self, status_dict):
+        super().__init__()
+        self.status_dict = status_dict
+        self.tracked = {}
+
+    def track(self, file_path, file_key, expected_total_size):
+        now = time.time()
+        state = {
+            "file_key": file_key,
+            "expected": expected_total_size,
+            "start_time": now,
+            "last_update_time": now,
+            "last_ui_update": now,
+            "last_size": 0,
+            "last_progress": 0,
+            "avg_speed": 0.0,
+        }
+        # yt-dlp writes to "<name>.part" and renames on completion
+        self.tracked[file_path] = state
+        self.tracked[file_path + ".part"] = state
+
+    def untrack(self, file_path):
+        self.tracked.pop(file_path, None)
+        self.tracked.pop(file_path + ".part", None)
+
+    def on_created(self, event):
+        self._update(event)
+
+    def on_modified(self, event):
+        self._update(event)
+
+    def _update(self, event):
+        if event.is_directory:
+            return
+        state = self.tracked.get(event.src_path)
+        if state is None:
+            return
+        file_key = state["file_key"]
+        fs = self.status_dict.get(file_key)
+        if fs is None or fs.status != "downloading":
+            return
+        current_time = time.time()
+        time_diff = current_time - state["last_update_time"]
+        if time_diff <= 0.5:
+            return
+        try:
+            current_size = os.path.getsize(event.src_path)
+        except OSError:
+            return
+        instant_speed = (current_size - state["last_size"]) / time_diff
+        avg_speed = state["avg_speed"]
+        avg_speed = instant_speed if avg_speed == 0 else 0.8 * avg_speed + 0.2 * instant_speed
+        expected_total_size = state["expected"]
+        last_progress = state["last_progress"]
+        if expected_total_size and expected_total_size > 0:
+            progress = int((current_size / expected_total_size) * 100)
+            progress = max(0, min(progress, 99))
+            remaining_bytes = max(0, expected_total_size - current_size)
+            eta = (remaining_bytes / avg_speed) if avg_speed > 0 else 0
+        else:
+            progress = last_progress
+            eta = 0
+        if (progress - last_progress >= 1) or progress in (0, 99) or (current_time - state["last_ui_update"] >= 1.0):
+            fs.update_progress(progress, current_size, avg_speed, eta, current_time - state["start_time"])
+            _notify(self.status_dict)
+            state["last_progress"] = progress
+            state["last_ui_update"] = current_time
+        state["avg_speed"] = avg_speed
+        state["last_size"] = current_size
+        state["last_update_time"] = current_time
+
+
+def download_all_files(files, selected, download_dir, status_dict, stop_event):
+    """Download selected files via aria2 RPC or aiohttp (direct links) and yt-dlp (YouTube), with concurrency control.
+
+    The workers run without a session, so Stop reaches them through stop_event.
+    """
+    # Hash lookups for the per-file membership checks instead of scanning the list
+    selected = set(selected)
     max_concurrency = st.session_state.get("max_concurrency", -1)
     if max_concurrency == 0:
         for file in files:
             if file["name"] in selected:
-                status_dict[file["name"]] = {"status": "downloads disabled", "progress": 0}
+                set_file_status(status_dict, file["name"], "downloads disabled")
         return None
     elif max_concurrency == -1:
         max_workers = min(len(selected), 20)
     else:
         max_workers = max(1, max_concurrency)
 
+    progress_handler = _ProgressEventHandler(status_dict)
+    terminal = ensure_terminal()
+
     def download_single_file(file):
         if file["name"] not in selected:
             return
+        if stop_event.is_set():
+            set_file_status(status_dict, file["name"], "stopped")
+            return
         safe_name = normalize_filename(file["name"])
         file_path = os.path.join(download_dir, safe_name)
         file_key = file["name"]
         if os.path.exists(file_path) and os.path.getsize(file_path) > 1024:
-            status_dict[file_key] = {"status": "already downloaded", "progress": 100}
+            set_file_status(status_dict, file_key, "already downloaded", 100)
             return
-        status_dict[file_key] = {"status": "downloading", "progress": 0}
-        if "terminal_output" not in st.session_state:
-            st.session_state.terminal_output = TerminalOutput()
-        expected_total_size = 0
+        set_file_status(status_dict, file_key, "downloading")
+        # Size reported at extraction time; when unknown only speed and bytes are tracked
+        progress_handler.track(file_path, file_key, file.get("filesize") or 0)
         try:
-            expected_total_size = _get_remote_file_size(file["url"])
-        except Exception:
-            pass
-
-        def update_progress():
-            start_time = time.time()
-            last_progress = 0
-            last_size = 0
-            last_update_time = start_time
-            last_ui_update = start_time
-            avg_speed = 0.0
-            while status_dict[file_key]["status"] == "downloading" and not st.session_state.get("stop_downloads"):
-                if os.path.exists(file_path):
-                    current_size = os.path.getsize(file_path)
-                    current_time = time.time()
-                    elapsed = current_time - start_time
-                    if current_time - last_update_time > 0.5:
-                        size_diff = current_size - last_size
-                        time_diff = current_time - last_update_time
-                        instant_speed = size_diff / time_diff if time_diff > 0 else 0
-                        avg_speed = instant_speed if avg_speed == 0 else 0.8 * avg_speed + 0.2 * instant_speed
-                        if expected_total_size and expected_total_size > 0:
-                            progress = int((current_size / expected_total_size) * 100)
-                            progress = max(0, min(progress, 99))
-                            remaining_bytes = max(0, expected_total_size - current_size)
-                            eta = (remaining_bytes / avg_speed) if avg_speed > 0 else 0
-                        else:
-                            progress = last_progress
-                            eta = 0
-                        if (progress - last_progress >= 1) or progress in (0, 99) or (current_time - last_ui_update >= 1.0):
-                            status_dict[file_key].update({
-                                "progress": progress,
-                                "downloaded": current_size,
-                                "speed": avg_speed,
-                                "eta": eta,
-                                "elapsed": elapsed,
-                            })
-                            last_progress = progress
-                            last_ui_update = current_time
-                        last_size = current_size
-                        last_update_time = current_time
-                time.sleep(0.5)
-
-        progress_thread = threading.Thread(target=update_progress, daemon=True)
-        progress_thread.start()
-        success, error = download_file_with_shell(file["url"], file_path, file, progress_callback=None)
+            success, error = download_youtube_entry(file_path, file, terminal, stop_event)
+        finally:
+            progress_handler.untrack(file_path)
         if success:
-            status_dict[file_key] = {"status": "completed", "progress": 100}
+            set_file_status(status_dict, file_key, "completed", 100)
+        elif stop_event.is_set():
+            set_file_status(status_dict, file_key, "stopped")
         else:
-            status_dict[file_key] = {"status": f"error: {error}", "progress": 0}
+            set_file_status(status_dict, file_key, f"error: {error}")
+
+    def run_aria2(rpc_files):
+        """Feed direct links to the shared aria2 daemon, at most max_workers at a time.
+
+        The cap is kept here rather than with changeGlobalOption, which would also
+        throttle the torrents queued on the same daemon. One batched tellStatus per
+        second covers every active GID.
+        """
+        start_time = time.time()
+        queue = collections.deque()
+        for file in rpc_files:
+            safe_name = normalize_filename(file["name"])
+            file_path = os.path.join(download_dir, safe_name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) > 1024 and not os.path.exists(file_path + ".aria2"):
+                set_file_status(status_dict, file["name"], "already downloaded", 100)
+            else:
+                set_file_status(status_dict, file["name"], "queued")
+                queue.append((file, safe_name))
+        pending = {}
+        while (queue or pending) and not stop_event.is_set():
+            while queue and len(pending) < max_workers:
+                file, safe_name = queue.popleft()
+                try:
+                    gid = add_uri(file["url"], {
+                        "dir": download_dir,
+                        "out": safe_name,
+                        "split": "16",
+                        "max-connection-per-server": "16",
+                        "min-split-size": "1M",
+                    })
+                except Exception as e:
+                    set_file_status(status_dict, file["name"], f"error: {e}")
+                    continue
+                pending[gid] = file["name"]
+                set_file_status(status_dict, file["name"], "downloading")
+            if not pending:
+                continue
+            gids = list(pending)
+            try:
+                statuses = tell_status_many(gids, ARIA2_STATUS_KEYS)
+            except Exception as e:
+                for file_key in pending.values():
+                    set_file_status(status_dict, file_key, f"error: {e}")
+                for file, _safe_name in queue:
+                    set_file_status(status_dict, file["name"], f"error: {e}")
+                return
+            for gid, info in zip(gids, statuses):
+                file_key = pending[gid]
+                state = info.get("status")
+                if state == "complete":
+                    set_file_status(status_dict, file_key, "completed", 100)
+                    del pending[gid]
+                elif state in ("error", "removed"):
+                    if stop_event.is_set():
+                        # Removed by Stop between the check above and this poll
+                        set_file_status(status_dict, file_key, "stopped")
+                    else:
+                        message = info.get("errorMessage") or state
+                        set_file_status(status_dict, file_key, f"error: {message}")
+                    del pending[gid]
+                elif state == "waiting":
+                    set_file_status(status_dict, file_key, "queued")
+                else:
+                    total = int(info.get("totalLength", 0))
+                    done = int(info.get("completedLength", 0))
+                    speed = int(info.get("downloadSpeed", 0))
+                    progress = max(0, min(int(done * 100 / total), 99)) if total else 0
+                    eta = (total - done) / speed if total and speed > 0 else 0
+                    fs = set_file_status(status_dict, file_key, "paused" if state == "paused" else "downloading")
+                    fs.update_progress(progress, done, speed, eta, time.time() - start_time)
+                    _notify(status_dict)
+            # Wakes at once when Stop is pressed
+            stop_event.wait(1)
+        if pending:
+            try:
+                aria2_multicall([("aria2.forceRemove", gid) for gid in pending])
+            except Exception:
+                pass
+        for file_key in pending.values():
+            set_file_status(status_dict, file_key, "stopped")
+        for file, _safe_name in queue:
+            set_file_status(status_dict, file["name"], "stopped")
 
     def download_worker():
         files_to_download = [f for f in files if f["name"] in selected]
         if not files_to_download:
             return
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_file = {executor.submit(download_single_file, file): file for file in files_to_download}
-            for future in concurrent.futures.as_completed(future_to_file):
-                file = future_to_file[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    status_dict[file["name"]] = {"status": f"error: {str(e)}", "progress": 0}
+        rpc_files = []
+        direct_files = [f for f in files_to_download if not f.get("is_youtube")]
+        if direct_files and ensure_aria2_daemon():
+            rpc_files = direct_files
+        rpc_keys = {f["name"] for f in rpc_files}
+        http_files = []
+        for f in direct_files:
+            if f["name"] in rpc_keys:
+                continue
+            file_path = os.path.join(download_dir, normalize_filename(f["name"]))
+            if os.path.exists(file_path) and os.path.getsize(file_path) > 1024:
+                set_file_status(status_dict, f["name"], "already downloaded", 100)
+            else:
+                http_files.append(f)
+        youtube_files = [f for f in files_to_download if f.get("is_youtube")]
+
+        tracker = None
+        if rpc_files:
+            tracker = threading.Thread(target=run_aria2, args=(rpc_files,), daemon=True)
+            tracker.start()
+
+        watch = None
+        if youtube_files:
+            try:
+                watch = _get_observer().schedule(progress_handler, download_dir, recursive=False)
+            except Exception:
+                pass
+        try:
+            # yt-dlp stays on subprocesses; direct links run on this thread's event loop meanwhile
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                future_to_file = {executor.submit(download_single_file, file): file for file in youtube_files}
+                if http_files:
+                    try:
+                        asyncio.run(_download_http_files(http_files, download_dir, max_workers, status_dict, stop_event))
+                    except Exception as e:
+                        for file in http_files:
+                            fs = status_dict.get(file["name"])
+                            if fs is None or fs.status == "downloading":
+                                set_file_status(status_dict, file["name"], f"error: {str(e)}")
+                pending = set(future_to_file)
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, timeout=0.5)
+                    if stop_event.is_set():
+                        # Queued yt-dlp jobs never start once Stop is pressed
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        cancelled = {f for f in pending if f.cancelled()}
+                        done |= cancelled
+                        pending -= cancelled
+                    for future in done:
+                        file = future_to_file[future]
+                        if future.cancelled():
+                            set_file_status(status_dict, file["name"], "stopped")
+                            continue
+                        try:
+                            future.result()
+                        except Exception as e:
+                            set_file_status(status_dict, file["name"], f"error: {str(e)}")
+        finally:
+            if watch is not None:
+                _get_observer().unschedule(watch)
+
+        if tracker is not None:
+            tracker.join()
 
     thread = threading.Thread(target=download_worker, daemon=True)
     thread.start()
     return thread
 
 
-async def prepare_streaming_urls(files, selected, download_dir):
-    """Prepare URLs for streaming, prioritizing local files over network streams."""
+async def prepare_streaming_urls(files, selected, download_dir, terminal):
+    """Prepare URLs for streaming, prioritizing local files over network streams.
+
+    Runs on the shared background loop, so the caller passes its session's terminal.
+    """
     urls = []
     names = []
-    if "terminal_output" not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    terminal = st.session_state.terminal_output
+    # One directory scan instead of exists+getsize per candidate path
+    entries = {}
+    if os.path.isdir(download_dir):
+        with os.scandir(download_dir) as it:
+            entries = {e.name: e for e in it}
+    abs_dir = os.path.abspath(download_dir)
+    selected = set(selected)
     for file in files:
         if file["name"] in selected:
             names.append(file["name"])
-            local_file_path = os.path.join(download_dir, normalize_filename(file["name"]))
-            alt_local_file_path = os.path.join(download_dir, file["name"])
-            candidate_path = None
-            if os.path.exists(local_file_path) and os.path.getsize(local_file_path) > 1024:
-                candidate_path = local_file_path
-            elif os.path.exists(alt_local_file_path) and os.path.getsize(alt_local_file_path) > 1024:
-                candidate_path = alt_local_file_path
-            if candidate_path is not None:
-                abs_path = os.path.abspath(candidate_path)
-                file_uri = Path(abs_path).as_uri()
-                urls.append(file_uri)
+            candidate_name = None
+            for candidate in (normalize_filename(file["name"]), file["name"]):
+                entry = entries.get(candidate)
+                if entry is not None and entry.is_file() and entry.stat().st_size > 1024:
+                    candidate_name = entry.name
+                    break
+            if candidate_name is not None:
+                urls.append(file_uri(os.path.join(abs_dir, candidate_name)))
                 terminal.add_line(f"Using local file: {file['name']}", "info")
             else:
                 terminal.add_line(f"Streaming from network: {file['name']}", "info")
@@ -357,21 +640,41 @@ async def prepare_streaming_urls(files, selected, download_dir):
     return urls, names
 
 
-async def get_youtube_direct_url(webpage_url, audio_only=False):
-    """Extract direct URL for a YouTube video when needed."""
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _extract_direct_url(webpage_url, audio_only=False):
+    """Resolve a direct media URL; short TTL because signed URLs expire."""
     ydl_opts = {
         "quiet": True,
         "skip_download": True,
         "format": "bestaudio[ext=mp3]/bestaudio/best" if audio_only else "best[ext=mp4]/best",
     }
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(webpage_url, download=False)
+        if isinstance(info, dict) and "url" in info:
+            return info["url"]
+        return webpage_url
+
+
+async def get_youtube_direct_url(webpage_url, audio_only=False):
+    """Extract direct URL for a YouTube video when needed."""
     loop = asyncio.get_event_loop()
-    def run_yt():
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(webpage_url, download=False)
-            if isinstance(info, dict) and "url" in info:
-                return info["url"]
-            return webpage_url
-    return await loop.run_in_executor(None, run_yt)
+    return await loop.run_in_executor(None, _extract_direct_url, webpage_url, audio_only)
+
+
+def _find_vlc():
+    """Locate the VLC binary once per session via PATH lookup instead of probing each candidate."""
+    vlc = st.session_state.get("vlc_path")
+    if vlc:
+        return vlc
+    vlc = shutil.which("vlc") or next(
+        (p for p in ("/snap/bin/vlc", "/usr/bin/vlc", "/usr/local/bin/vlc") if os.access(p, os.X_OK)),
+        None,
+    )
+    if vlc:
+        st.session_state["vlc_path"] = vlc
+    return vlc
 
 
 def stream_all_in_vlc(urls, names):
@@ -382,9 +685,9 @@ def stream_all_in_vlc(urls, names):
     terminal.add_line(f"Starting VLC streaming for {len(urls)} files", "info")
     try:
         if sys.platform == "darwin":
-            with tempfile.NamedTemporaryFile("w", suffix=".m3u", delete=False) as m3u:
-                for name, url in zip(names, urls):
-                    m3u.write(f"#EXTINF:-1,{name}\n{url}\n")
+            entries = [f"#EXTINF:-1,{name}\n{url}\n" for name, url in zip(names, urls)]
+            with tempfile.NamedTemporaryFile("w", suffix=".m3u", delete=False, encoding="utf-8") as m3u:
+                m3u.write("#EXTM3U\n" + "".join(entries))
                 m3u_path = m3u.name
             subprocess.Popen(["open", "-a", "VLC", m3u_path])
             terminal.add_line("Launched VLC on macOS", "info")
@@ -393,40 +696,35 @@ def stream_all_in_vlc(urls, names):
             terminal.add_line("Launched VLC on Windows", "info")
         else:
             # Linux: try default GUI first (no --intf), then qt; avoid dummy (headless, no window)
-            vlc_paths = ["vlc", "/snap/bin/vlc", "/usr/bin/vlc", "/usr/local/bin/vlc"]
+            vlc_path = _find_vlc()
             vlc_found = False
-            for vlc_path in vlc_paths:
-                try:
-                    result = subprocess.run([vlc_path, "--version"], capture_output=True, text=True, timeout=5)
-                    if result.returncode == 0:
-                        terminal.add_line(f"Found VLC at: {vlc_path}", "info")
-                        # Try default (opens GUI) then qt; do not use dummy (no window)
-                        for vlc_args in [
-                            [vlc_path] + urls,
-                            [vlc_path, "--intf", "qt", "--no-video-title-show"] + urls,
-                        ]:
-                            try:
-                                env = os.environ.copy()
-                                env.setdefault("DISPLAY", ":0")
-                                process = subprocess.Popen(
-                                    vlc_args,
-                                    stdout=subprocess.DEVNULL,
-                                    stderr=subprocess.PIPE,
-                                    env=env,
-                                    start_new_session=True,
-                                )
-                                time.sleep(1)
-                                if process.poll() is None:
-                                    terminal.add_line("VLC launched successfully", "info")
-                                    vlc_found = True
-                                    break
-                            except Exception as e:
-                                terminal.add_line(f"VLC launch attempt: {e}", "warning")
-                                continue
-                        if vlc_found:
+            if vlc_path:
+                terminal.add_line(f"Found VLC at: {vlc_path}", "info")
+                # Try default (opens GUI) then qt; do not use dummy (no window)
+                for vlc_args in [
+                    [vlc_path] + urls,
+                    [vlc_path, "--intf", "qt", "--no-video-title-show"] + urls,
+                ]:
+                    try:
+                        env = os.environ.copy()
+                        env.setdefault("DISPLAY", ":0")
+                        process = subprocess.Popen(
+                            vlc_args,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            env=env,
+                            start_new_session=True,
+                        )
+                        time.sleep(1)
+                        if process.poll() is None:
+                            terminal.add_line("VLC launched successfully", "info")
+                            vlc_found = True
                             break
-                except Exception:
-                    continue
+                    except Exception as e:
+                        terminal.add_line(f"VLC launch attempt: {e}", "warning")
+                        continue
+                if not vlc_found:
+                    st.session_state.pop("vlc_path", None)
             if not vlc_found:
                 raise Exception("VLC not found or could not start. Install with: sudo apt install vlc")
     except Exception as e:
@@ -2,19 +2,32 @@
 Video encoding: script creation, listing, trimming, intro/outro detection, and FFmpeg encode.
 """
 import os
+import concurrent.futures
+import ctypes
+import ctypes.util
+import functools
+import glob
+import hashlib
 import json
+import re
+import shlex
 import shutil
-import subprocess
 
 import numpy as np
 import streamlit as st
-import librosa
-from scipy.spatial.distance import cosine
 
 from .config import VIDEO_EXTENSIONS
-from .shell_utils import TerminalOutput, run_shell_command, run_shell_command_with_output
+from .shell_utils import TerminalOutput, ensure_stop_event, ensure_terminal, run_shell_command, run_shell_command_with_output
 from .platform_utils import PLATFORM_CONFIG
-from .prerequisites import detect_hardware_acceleration
+from .prerequisites import available_encoders, detect_hardware_acceleration
+
+# Sample rate of the mono WAVs used for intro/outro detection; log-mel energies are robust at 8 kHz
+ANALYSIS_SAMPLE_RATE = 8000
+# Feature frames are non-overlapping windows of this many samples
+_FRAME = 512
+_HANN = np.hanning(_FRAME).astype(np.float32)
+# Decode on whatever GPU/VPU ffmpeg finds (software if none) on the re-encode paths
+_HWDEC = ["-hwaccel", "auto"]
 
 # --- VIDEO ENCODING FUNCTIONS ---
 def create_video_encoder_script(download_dir):
@@ -48,51 +61,126 @@ def create_video_encoder_script(download_dir):
                     return False
     return os.path.exists(script_path)
 
+_VIDEO_EXT_SET = frozenset(VIDEO_EXTENSIONS)
+_DIGITS_RE = re.compile(r'(\d+)')
+
+def _natural_sort_key(name):
+    """Split digit runs out as ints so 'ep2' sorts before 'ep10' (like sort -V)."""
+    return [int(part) if part.isdigit() else part.lower() for part in _DIGITS_RE.split(name)]
+
+@functools.lru_cache(maxsize=64)
+def _scan_video_files(download_dir, mtime_ns):
+    """Naturally sorted video paths in download_dir; mtime_ns is part of the cache key."""
+    try:
+        # DirEntry.is_file() answers from the directory read's d_type; only symlinks cost a stat
+        with os.scandir(download_dir) as it:
+            files = [
+                entry.path for entry in it
+                if os.path.splitext(entry.name)[1].lower() in _VIDEO_EXT_SET and entry.is_file()
+            ]
+    except OSError:
+        return ()
+    files.sort(key=lambda f: _natural_sort_key(os.path.basename(f)))
+    return tuple(files)
+
 def list_video_files(download_dir):
-    """List video files in directory using shell commands"""
-    result = run_shell_command(f"find '{download_dir}' -maxdepth 1 -name '*.mp4' -o -name '*.mkv' -o -name '*.avi' -o -name '*.mov' -o -name '*.wmv' -o -name '*.flv' -o -name '*.webm' | sort -V")
-    
+    """List video files in directory, naturally sorted"""
+    # Adding, removing or renaming an entry bumps the directory mtime, so reruns that
+    # find it unchanged reuse the previous scan
+    try:
+        mtime_ns = os.stat(download_dir).st_mtime_ns
+    except OSError:
+        return []
+    return list(_scan_video_files(download_dir, mtime_ns))
+
+def run_ffmpeg(args, cwd=None, timeout=1800, input_text=None, cpu_affinity=None, terminal=None, stop_event=None):
+    """Run ffmpeg from an argv list (no /bin/sh, no quoting) and stream its output to the terminal.
+
+    Callers on worker threads must pass the session's terminal and stop_event.
+    """
+    return run_shell_command_with_output(["ffmpeg", *args], cwd=cwd, timeout=timeout, input_text=input_text,
+                                         cpu_affinity=cpu_affinity, terminal=terminal, stop_event=stop_event)
+
+@functools.lru_cache(maxsize=1)
+def _physical_cores():
+    """One logical CPU per physical core on Linux SMT machines, or None when pinning would not help."""
+    try:
+        allowed = os.sched_getaffinity(0)
+        cores = set()
+        for cpu in allowed:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list") as f:
+                first = f.read().strip().replace("-", ",").split(",")[0]
+            cores.add(int(first))
+    except (AttributeError, OSError, ValueError):
+        return None
+    cores &= allowed
+    return frozenset(cores) if cores and len(cores) < len(allowed) else None
+
+# Concat demuxer reading its list from stdin; list entries must be absolute paths
+_CONCAT_STDIN = ["-f", "concat", "-safe", "0", "-protocol_whitelist", "pipe,file", "-i", "pipe:0"]
+
+def _concat_list_line(path):
+    """One concat-demuxer 'file' directive; single quotes are escaped the way ffmpeg expects."""
+    return "file '" + path.replace("'", "'\\''") + "'\n"
+
+@functools.lru_cache(maxsize=1024)
+def _probe(path, mtime):
+    """Parsed ffprobe format+streams JSON for path; mtime is part of the cache key."""
+    result = run_shell_command(["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path])
     if result['success']:
-        files = [f.strip() for f in result['stdout'].split('\n') if f.strip()]
-        return files
-    return []
+        try:
+            return json.loads(result['stdout'])
+        except Exception:
+            return None
+    return None
+
+def _probe_file(file_path):
+    try:
+        return _probe(file_path, os.path.getmtime(file_path))
+    except OSError:
+        return None
 
 def get_video_info(file_path):
     """Get video information using ffprobe"""
-    cmd = f"ffprobe -v quiet -print_format json -show_format -show_streams '{file_path}'"
-    result = run_shell_command(cmd)
-    
-    if result['success']:
-        try:
-            data = json.loads(result['stdout'])
-            video_stream = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), None)
-            if video_stream:
-                return f"{video_stream.get('width', '?')}x{video_stream.get('height', '?')} - {video_stream.get('codec_name', '?')}"
-        except:
-            pass
+    data = _probe_file(file_path)
+    if data:
+        video_stream = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), None)
+        if video_stream:
+            return f"{video_stream.get('width', '?')}x{video_stream.get('height', '?')} - {video_stream.get('codec_name', '?')}"
     return "Unknown"
 
 def get_video_duration_seconds(file_path):
     """Get total duration in seconds using ffprobe."""
-    cmd = f"ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 '{file_path}'"
-    result = run_shell_command(cmd)
-    if result['success']:
+    data = _probe_file(file_path)
+    if data:
         try:
-            return float(result['stdout'].strip())
+            return float(data['format']['duration'])
         except Exception:
             return None
     return None
 
-def trim_video_remove_segments(src_path, intro_range=None, outro_range=None, work_dir=None, return_removed=False):
+def _concat_filter_args(src_path, segments, out_path):
+    """ffmpeg args that cut each (start, end) range of src_path and join them via -filter_complex concat."""
+    data = _probe_file(src_path) or {}
+    has_audio = any(s.get('codec_type') == 'audio' for s in data.get('streams', []))
+    args = ["-y"]
+    for start_t, end_t in segments:
+        args += [*_HWDEC, "-ss", f"{start_t:.3f}", "-to", f"{end_t:.3f}", "-i", src_path]
+    labels = "".join(f"[{i}:v:0][{i}:a:0]" if has_audio else f"[{i}:v:0]" for i in range(len(segments)))
+    graph = f"{labels}concat=n={len(segments)}:v=1:a={int(has_audio)}[v]" + ("[a]" if has_audio else "")
+    args += ["-filter_complex", graph, "-map", "[v]"]
+    if has_audio:
+        args += ["-map", "[a]", "-c:a", "aac"]
+    return args + ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", out_path]
+
+def trim_video_remove_segments(src_path, intro_range=None, outro_range=None, work_dir=None, return_removed=False,
+                               terminal=None, stop_event=None):
     """
     Create a trimmed copy of src_path that removes [intro_start,intro_end] and [outro_start,outro_end].
     - intro_range/outro_range: tuples of (start_sec, end_sec) relative to episode. Use None to skip.
+    - terminal/stop_event: the session's objects, required when called from a worker thread.
     Returns (success, trimmed_path or error_message)
     """
-    # Ensure terminal_output exists in session state
-    if 'terminal_output' not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    terminal = st.session_state.terminal_output
 
     duration = get_video_duration_seconds(src_path)
     if duration is None or duration <= 0:
@@ -149,42 +237,33 @@ def trim_video_remove_segments(src_path, intro_range=None, outro_range=None, wor
     trimmed_dir = os.path.join(base_dir, "trimmed")
     os.makedirs(trimmed_dir, exist_ok=True)
     base_name = os.path.splitext(os.path.basename(src_path))[0]
-    part_paths = []
     removed_paths = []
+    trimmed_out = os.path.join(trimmed_dir, f"{base_name}.trimmed.mp4")
 
-    # Extract parts
-    for idx, (start_t, end_t) in enumerate(keep_segments):
-        part_out = os.path.join(trimmed_dir, f"{base_name}.part{idx+1}.mp4")
-        # Use stream copy where possible; accuracy depends on keyframes
-        cmd = (
-            f"ffmpeg -y -ss {start_t:.3f} -to {end_t:.3f} -i '{src_path}' -c copy '{part_out}' 2>&1"
-        )
-        res = run_shell_command_with_output(cmd, timeout=1800)
-        if not res['success'] or not os.path.exists(part_out) or os.path.getsize(part_out) == 0:
+    if len(keep_segments) == 1:
+        # Only a leading intro or trailing outro is removed: cut straight to the output
+        start_t, end_t = keep_segments[0]
+        cut = ["-y", "-ss", f"{start_t:.3f}", "-to", f"{end_t:.3f}", "-i", src_path]
+        res = run_ffmpeg([*cut, "-c", "copy", trimmed_out], terminal=terminal, stop_event=stop_event)
+        if not res['success'] or not os.path.exists(trimmed_out) or os.path.getsize(trimmed_out) == 0:
             # Fallback to fast re-encode for the segment
-            cmd2 = (
-                f"ffmpeg -y -ss {start_t:.3f} -to {end_t:.3f} -i '{src_path}' -c:v libx264 -preset veryfast -crf 20 -c:a copy '{part_out}' 2>&1"
-            )
-            res2 = run_shell_command_with_output(cmd2, timeout=1800)
+            res2 = run_ffmpeg(["-y", *_HWDEC, *cut[1:], "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-c:a", "copy", trimmed_out], terminal=terminal, stop_event=stop_event)
             if not res2['success']:
-                return False, f"Failed to create segment {idx+1}"
-        part_paths.append(part_out)
-
-    # Concat parts into one trimmed file
-    list_file = os.path.join(trimmed_dir, f"{base_name}_parts.txt")
-    with open(list_file, 'w') as lf:
-        for p in part_paths:
-            esc = p.replace("'", "'\"'\"'")
-            lf.write(f"file '{esc}'\n")
-    trimmed_out = os.path.join(trimmed_dir, f"{base_name}.trimmed.mp4")
-    concat_cmd = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' -c copy '{trimmed_out}' 2>&1"
-    resc = run_shell_command_with_output(concat_cmd, timeout=1800)
-    if not resc['success'] or not os.path.exists(trimmed_out) or os.path.getsize(trimmed_out) == 0:
-        # Fallback to re-encode on concat
-        concat_cmd2 = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' -c:v libx264 -preset veryfast -crf 20 -c:a copy '{trimmed_out}' 2>&1"
-        resc2 = run_shell_command_with_output(concat_cmd2, timeout=1800)
-        if not resc2['success']:
-            return False, "Failed to concat trimmed parts"
+                return False, "Failed to create segment 1"
+    else:
+        # The concat demuxer reads each kept range straight from the source via
+        # inpoint/outpoint, so no intermediate part files are written
+        src_line = _concat_list_line(os.path.abspath(src_path))
+        parts_text = "".join(
+            f"{src_line}inpoint {start_t:.3f}\noutpoint {end_t:.3f}\n" for start_t, end_t in keep_segments
+        )
+        resc = run_ffmpeg(["-y", *_CONCAT_STDIN, "-c", "copy", trimmed_out], input_text=parts_text, terminal=terminal, stop_event=stop_event)
+        if not resc['success'] or not os.path.exists(trimmed_out) or os.path.getsize(trimmed_out) == 0:
+            # Fallback to re-encode: one ffmpeg process decodes each kept range and
+            # joins them with the concat filter, so nothing intermediate hits the disk
+            resc2 = run_ffmpeg(_concat_filter_args(src_path, keep_segments, trimmed_out), terminal=terminal, stop_event=stop_event)
+            if not resc2['success']:
+                return False, "Failed to concat trimmed parts"
 
     # Optionally extract removed segments for verification
     if return_removed and removed_segments:
@@ -192,15 +271,10 @@ def trim_video_remove_segments(src_path, intro_range=None, outro_range=None, wor
         os.makedirs(removed_dir, exist_ok=True)
         for idx, (start_t, end_t) in enumerate(removed_segments):
             r_out = os.path.join(removed_dir, f"{base_name}.removed{idx+1}.mp4")
-            cmdr = (
-                f"ffmpeg -y -ss {start_t:.3f} -to {end_t:.3f} -i '{src_path}' -c copy '{r_out}' 2>&1"
-            )
-            resr = run_shell_command_with_output(cmdr, timeout=1800)
+            cut = ["-y", "-ss", f"{start_t:.3f}", "-to", f"{end_t:.3f}", "-i", src_path]
+            resr = run_ffmpeg([*cut, "-c", "copy", r_out], terminal=terminal, stop_event=stop_event)
             if (not resr['success']) or (not os.path.exists(r_out)) or (os.path.getsize(r_out) == 0):
-                cmdr2 = (
-                    f"ffmpeg -y -ss {start_t:.3f} -to {end_t:.3f} -i '{src_path}' -c:v libx264 -preset veryfast -crf 20 -c:a copy '{r_out}' 2>&1"
-                )
-                resr2 = run_shell_command_with_output(cmdr2, timeout=1800)
+                resr2 = run_ffmpeg(["-y", *_HWDEC, *cut[1:], "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-c:a", "copy", r_out], terminal=terminal, stop_event=stop_event)
                 if not resr2['success']:
                     # skip this removed part on failure
                     continue
@@ -208,12 +282,8 @@ def trim_video_remove_segments(src_path, intro_range=None, outro_range=None, wor
 
     return (True, trimmed_out, removed_paths) if return_removed else (True, trimmed_out)
 
-def extract_audio_for_analysis(video_path, work_dir=None):
-    """Extract low-rate mono audio for similarity analysis"""
-    if 'terminal_output' not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    terminal = st.session_state.terminal_output
-    
+def extract_audio_for_analysis(video_path, work_dir=None, terminal=None, stop_event=None):
+    """Extract low-rate mono audio for similarity analysis (pass terminal/stop_event off the script thread)"""
     work_dir = work_dir or os.path.dirname(video_path)
     audio_dir = os.path.join(work_dir, "analysis_audio")
     os.makedirs(audio_dir, exist_ok=True)
@@ -221,14 +291,56 @@ def extract_audio_for_analysis(video_path, work_dir=None):
     base_name = os.path.splitext(os.path.basename(video_path))[0]
     audio_path = os.path.join(audio_dir, f"{base_name}.wav")
     
-    # Extract 16kHz mono audio for analysis
-    cmd = f"ffmpeg -y -i '{video_path}' -ar 16000 -ac 1 -f wav '{audio_path}' 2>&1"
-    result = run_shell_command_with_output(cmd, timeout=300)
+    # Reuse a WAV extracted after the video last changed, so its feature cache stays valid
+    try:
+        if os.path.getsize(audio_path) > 0 and os.path.getmtime(audio_path) >= os.path.getmtime(video_path):
+            return audio_path
+    except OSError:
+        pass
+    
+    # Extract 8kHz mono audio for analysis; -vn keeps ffmpeg from touching the video stream.
+    # The WAV is published only on success, so a timed-out or stopped run never leaves a
+    # truncated file for the reuse check above to accept
+    tmp_path = _partial_path(audio_path)
+    result = run_ffmpeg(["-y", "-i", video_path, "-vn", "-ar", str(ANALYSIS_SAMPLE_RATE), "-ac", "1", "-f", "wav", tmp_path], timeout=300,
+                        terminal=terminal, stop_event=stop_event)
+    result = _publish_output(tmp_path, audio_path, result)
     
     if result['success'] and os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
         return audio_path
     return None
 
+def _extract_audio_parallel(video_files, work_dir=None):
+    """Run extract_audio_for_analysis over several videos concurrently, preserving order."""
+    # Workers just block on ffmpeg, so threads are enough; they have no session, so
+    # the caller's terminal and stop event are looked up here and handed over
+    terminal = ensure_terminal()
+    stop_event = ensure_stop_event()
+    max_workers = max(1, min(os.cpu_count() or 1, 4, len(video_files)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(lambda vf: extract_audio_for_analysis(vf, work_dir, terminal, stop_event), video_files))
+
+def _load_analysis_audio(path, sr=ANALYSIS_SAMPLE_RATE):
+    """Read an analysis WAV as float32 mono via libsndfile; resample only if the rate differs."""
+    import soundfile as sf
+    y, file_sr = sf.read(path, dtype='float32')
+    if y.ndim > 1:
+        y = y.mean(axis=1)
+    if file_sr != sr:
+        import librosa
+        y = librosa.resample(y, orig_sr=file_sr, target_sr=sr)
+    return y, sr
+
+def _mean_pairwise_similarity(M):
+    """Average Pearson correlation over all distinct row pairs of M, via one M @ M.T."""
+    M = np.asarray(M, dtype=np.float32)
+    # Centre rows first: log-mel energies are all positive, so raw cosines sit near 1
+    M = M - M.mean(axis=1, keepdims=True)
+    M = M / (np.linalg.norm(M, axis=1, keepdims=True) + 1e-12)
+    S = M @ M.T
+    n = M.shape[0]
+    return float((S.sum() - np.trace(S)) / (n * (n - 1)))
+
 def analyze_audio_similarity(audio_paths, sample_duration=30):
     """
     Analyze audio similarity to detect intro/outro patterns.
@@ -237,6 +349,8 @@ def analyze_audio_similarity(audio_paths, sample_duration=30):
     if len(audio_paths) < 2:
         return None, None, (0, 0)
     
+    import soundfile as sf
+
     if 'terminal_output' not in st.session_state:
         st.session_state.terminal_output = TerminalOutput()
     terminal = st.session_state.terminal_output
@@ -244,99 +358,71 @@ def analyze_audio_similarity(audio_paths, sample_duration=30):
     terminal.add_line(f"Analyzing {len(audio_paths)} audio files for patterns...", "info")
     
     try:
-        # Load and analyze first few files
-        audio_data = []
+        # Load first few files and compute each track's log-mel features once; the
+        # window loops below slice frames out of them instead of recomputing per pair
+        feat_all = []
         durations = []
         
         for i, audio_path in enumerate(audio_paths[:min(5, len(audio_paths))]):  # Analyze up to 5 files
             if not os.path.exists(audio_path):
                 continue
                 
-            y, sr = librosa.load(audio_path, sr=16000)
-            audio_data.append(y)
-            durations.append(len(y) / sr)
+            sr = ANALYSIS_SAMPLE_RATE
+            feat_all.append(_cached_features(audio_path, sr=sr))
+            durations.append(sf.info(audio_path).duration)
             
             if i == 0:
-                terminal.add_line(f"Loaded audio: {len(y)/sr:.1f}s at {sr}Hz", "info")
+                terminal.add_line(f"Loaded audio: {durations[0]:.1f}s at {sr}Hz", "info")
         
-        if len(audio_data) < 2:
+        if len(feat_all) < 2:
             return None, None, (0, 0)
+        shortest_frames = min(m.shape[1] for m in feat_all)
         
         # Find intro pattern (first 30-90 seconds)
         intro_candidates = []
         outro_candidates = []
         
         # Analyze intro (first 30-90 seconds)
+        best_sim, miss_count = -1.0, 0
         for start_time in range(0, min(90, int(min(durations))), 10):
             end_time = min(start_time + sample_duration, int(min(durations)))
             if end_time - start_time < 20:  # Need at least 20s
                 continue
                 
-            similarities = []
-            for i in range(len(audio_data)):
-                for j in range(i+1, len(audio_data)):
-                    # Extract segments
-                    start_sample = int(start_time * 16000)
-                    end_sample = int(end_time * 16000)
-                    
-                    seg1 = audio_data[i][start_sample:end_sample]
-                    seg2 = audio_data[j][start_sample:end_sample]
-                    
-                    if len(seg1) > 0 and len(seg2) > 0:
-                        # Use MFCC features for comparison
-                        mfcc1 = librosa.feature.mfcc(y=seg1, sr=16000, n_mfcc=13)
-                        mfcc2 = librosa.feature.mfcc(y=seg2, sr=16000, n_mfcc=13)
-                        
-                        # Compare MFCCs
-                        if mfcc1.shape[1] > 0 and mfcc2.shape[1] > 0:
-                            # Pad to same length
-                            max_len = max(mfcc1.shape[1], mfcc2.shape[1])
-                            mfcc1_padded = np.pad(mfcc1, ((0,0), (0, max_len - mfcc1.shape[1])), mode='constant')
-                            mfcc2_padded = np.pad(mfcc2, ((0,0), (0, max_len - mfcc2.shape[1])), mode='constant')
-                            
-                            # Calculate cosine similarity
-                            sim = 1 - cosine(mfcc1_padded.flatten(), mfcc2_padded.flatten())
-                            similarities.append(sim)
-            
-            if similarities:
-                avg_similarity = np.mean(similarities)
+            # Fixed-width frame window so every track slices to one shape
+            f0 = int(start_time * sr / _FRAME)
+            width = min(int((end_time - start_time) * sr / _FRAME), shortest_frames - f0)
+            if width > 0:
+                seg_feat = np.stack([m[:, f0:f0 + width] for m in feat_all])  # (N, n_bands, width)
+                avg_similarity = _mean_pairwise_similarity(seg_feat.reshape(len(feat_all), -1))
                 intro_candidates.append((start_time, end_time, avg_similarity))
+                # Adjacent windows overlap heavily; stop once similarity has clearly fallen off
+                if avg_similarity < best_sim - 0.1:
+                    miss_count += 1
+                    if miss_count >= 2:
+                        break
+                best_sim = max(best_sim, avg_similarity)
         
         # Analyze outro (last 30-90 seconds)
+        best_sim, miss_count = -1.0, 0
         for end_time in range(int(min(durations)), max(0, int(min(durations)) - 90), -10):
             start_time = max(0, end_time - sample_duration)
             if end_time - start_time < 20:  # Need at least 20s
                 continue
                 
-            similarities = []
-            for i in range(len(audio_data)):
-                for j in range(i+1, len(audio_data)):
-                    # Extract segments
-                    start_sample = int(start_time * 16000)
-                    end_sample = int(end_time * 16000)
-                    
-                    seg1 = audio_data[i][start_sample:end_sample]
-                    seg2 = audio_data[j][start_sample:end_sample]
-                    
-                    if len(seg1) > 0 and len(seg2) > 0:
-                        # Use MFCC features for comparison
-                        mfcc1 = librosa.feature.mfcc(y=seg1, sr=16000, n_mfcc=13)
-                        mfcc2 = librosa.feature.mfcc(y=seg2, sr=16000, n_mfcc=13)
-                        
-                        # Compare MFCCs
-                        if mfcc1.shape[1] > 0 and mfcc2.shape[1] > 0:
-                            # Pad to same length
-                            max_len = max(mfcc1.shape[1], mfcc2.shape[1])
-                            mfcc1_padded = np.pad(mfcc1, ((0,0), (0, max_len - mfcc1.shape[1])), mode='constant')
-                            mfcc2_padded = np.pad(mfcc2, ((0,0), (0, max_len - mfcc2.shape[1])), mode='constant')
-                            
-                            # Calculate cosine similarity
-                            sim = 1 - cosine(mfcc1_padded.flatten(), mfcc2_padded.flatten())
-                            similarities.append(sim)
-            
-            if similarities:
-                avg_similarity = np.mean(similarities)
+            # Fixed-width frame window so every track slices to one shape
+            f0 = int(start_time * sr / _FRAME)
+            width = min(int((end_time - start_time) * sr / _FRAME), shortest_frames - f0)
+            if width > 0:
+                seg_feat = np.stack([m[:, f0:f0 + width] for m in feat_all])  # (N, n_bands, width)
+                avg_similarity = _mean_pairwise_similarity(seg_feat.reshape(len(feat_all), -1))
                 outro_candidates.append((start_time, end_time, avg_similarity))
+                # Adjacent windows overlap heavily; stop once similarity has clearly fallen off
+                if avg_similarity < best_sim - 0.1:
+                    miss_count += 1
+                    if miss_count >= 2:
+                        break
+                best_sim = max(best_sim, avg_similarity)
         
         # Find best intro candidate (highest similarity)
         best_intro = None
@@ -377,11 +463,7 @@ def auto_detect_intro_outro(video_files, work_dir):
     terminal.add_line("Starting automatic intro/outro detection...", "info")
     
     # Extract audio from videos
-    audio_paths = []
-    for video_file in video_files:
-        audio_path = extract_audio_for_analysis(video_file, work_dir)
-        if audio_path:
-            audio_paths.append(audio_path)
+    audio_paths = [p for p in _extract_audio_parallel(video_files, work_dir) if p]
     
     if len(audio_paths) < 2:
         terminal.add_line("Need at least 2 videos for pattern detection", "warning")
@@ -392,111 +474,154 @@ def auto_detect_intro_outro(video_files, work_dir):
     
     return intro_range, outro_range, confidence
 
-def _compute_mfcc(y, sr=16000):
-    mf = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    return mf
-
-def _avg_template(segments_mfcc):
-    # Pad to max time dimension and average
-    max_len = max(m.shape[1] for m in segments_mfcc)
-    stacked = []
-    for m in segments_mfcc:
-        if m.shape[1] < max_len:
-            m = np.pad(m, ((0,0),(0,max_len-m.shape[1])), mode='constant')
-        stacked.append(m)
-    return np.mean(np.stack(stacked, axis=0), axis=0)
-
-def build_intro_outro_templates(audio_paths, intro_range, outro_range, sr=16000):
-    """Build MFCC templates for intro and outro by averaging across files"""
+@functools.lru_cache(maxsize=4)
+def _mel_filterbank(sr):
+    import librosa
+    return librosa.filters.mel(sr=sr, n_fft=_FRAME, n_mels=40).astype(np.float32)
+
+def _compute_logmel(y, sr=ANALYSIS_SAMPLE_RATE):
+    """40-band log-mel energies over non-overlapping 512-sample frames, shape (40, frames)."""
+    n_frames = len(y) // _FRAME
+    frames = y[:n_frames * _FRAME].reshape(n_frames, _FRAME) * _HANN
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    # float32 keeps the similarity products on SGEMM/SGEMV (half the bandwidth)
+    return np.log1p(_mel_filterbank(sr) @ power.T).astype(np.float32, copy=False)
+
+def _feature_cache_prefix(path):
+    return os.path.join(os.path.dirname(path), f".logmel_{os.path.splitext(os.path.basename(path))[0]}_")
+
+def _feature_cache_path(path, sr=ANALYSIS_SAMPLE_RATE):
+    key = hashlib.blake2b(f"{path}|{os.path.getmtime(path)}|{sr}|logmel40|{_FRAME}".encode()).hexdigest()[:16]
+    return f"{_feature_cache_prefix(path)}{key}.npy"
+
+def _cached_features(path, sr=ANALYSIS_SAMPLE_RATE):
+    """Full-track log-mel features for an analysis WAV, cached as .npy beside it (keyed by path, mtime, params)."""
+    cache_path = _feature_cache_path(path, sr)
+    if os.path.exists(cache_path):
+        try:
+            return np.load(cache_path).astype(np.float32, copy=False)
+        except Exception:
+            pass
+    y, _sr = _load_analysis_audio(path, sr=sr)
+    feats = _compute_logmel(y, sr)
+    try:
+        # Drop caches left by earlier extractions of the same file before writing the new one
+        for stale in glob.glob(glob.escape(_feature_cache_prefix(path)) + "*.npy"):
+            if stale != cache_path:
+                os.remove(stale)
+        np.save(cache_path, feats)
+    except Exception:
+        pass
+    return feats
+
+def _avg_template(segments):
+    # Crop to the shared time dimension and average (no zero-padded copies)
+    width = min(m.shape[1] for m in segments)
+    return np.stack([m[:, :width] for m in segments]).mean(axis=0, dtype=np.float32)
+
+def build_intro_outro_templates(features, intro_range, outro_range, sr=ANALYSIS_SAMPLE_RATE):
+    """Build log-mel templates for intro and outro by averaging precomputed per-file features"""
     intro_template = None
     outro_template = None
     segments_intro = []
     segments_outro = []
-    for path in audio_paths:
-        if not os.path.exists(path):
-            continue
-        y, _sr = librosa.load(path, sr=sr)
-        if intro_range:
-            s = int(intro_range[0]*sr); e = int(intro_range[1]*sr)
-            seg = y[s:e]
-            if seg.size > sr*5:
-                segments_intro.append(_compute_mfcc(seg, sr))
-        if outro_range:
-            s = int(outro_range[0]*sr); e = int(outro_range[1]*sr)
-            seg = y[s:e]
-            if seg.size > sr*5:
-                segments_outro.append(_compute_mfcc(seg, sr))
+    min_frames = int(5*sr/_FRAME)  # segments shorter than 5s are ignored
+    for feats in features:
+        for rng, segments in ((intro_range, segments_intro), (outro_range, segments_outro)):
+            if not rng:
+                continue
+            seg = feats[:, int(rng[0]*sr/_FRAME):int(rng[1]*sr/_FRAME)]
+            if seg.shape[1] > min_frames:
+                segments.append(seg)
     if segments_intro:
         intro_template = _avg_template(segments_intro)
     if segments_outro:
         outro_template = _avg_template(segments_outro)
     return intro_template, outro_template
 
-def detect_segment_offset(audio_path, template_mfcc, search_start, search_end, sr=16000, hop_seconds=1.0):
-    """Slide template over search window; return best (start,end,sim) in seconds."""
-    if template_mfcc is None:
+@functools.lru_cache(maxsize=1)
+def _sliding_correlation_kernel():
+    """Numba sliding-window correlation kernel, or None to use the NumPy path."""
+    try:
+        from .numba_kernels import sliding_correlation
+        return sliding_correlation
+    except Exception:
         return None
-    if not os.path.exists(audio_path):
+
+def detect_segment_offset(features, template, search_start, search_end, sr=ANALYSIS_SAMPLE_RATE, hop_seconds=1.0):
+    """Slide template over a file's precomputed features; return best (start,end,sim) in seconds."""
+    if template is None or features is None:
         return None
-    y, _sr = librosa.load(audio_path, sr=sr)
-    total_dur = len(y)/sr
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    # Slide over the full-track features by frame index instead of recomputing per window
+    M = features
+    frame_sec = _FRAME/float(sr)
+    total_dur = M.shape[1] * frame_sec
     search_start = max(0.0, search_start)
     search_end = min(total_dur, search_end)
-    tpl_len_frames = template_mfcc.shape[1]
-    # Approximate hop length 512 by default in librosa
-    tpl_len_sec = tpl_len_frames * (512/float(sr))
-    best_sim = -1.0
-    best_start = None
-    step = max(1, int(hop_seconds*sr))
-    start_idx = int(search_start*sr)
-    end_idx = max(start_idx+int(tpl_len_sec*sr), int(search_end*sr))
-    for s in range(start_idx, end_idx, step):
-        e = s + int(tpl_len_sec*sr)
-        if e > len(y):
-            break
-        seg = y[s:e]
-        mf = _compute_mfcc(seg, sr)
-        # Pad to same width
-        max_len = max(mf.shape[1], template_mfcc.shape[1])
-        mf_p = np.pad(mf, ((0,0),(0,max_len-mf.shape[1])), mode='constant')
-        tpl_p = np.pad(template_mfcc, ((0,0),(0,max_len-template_mfcc.shape[1])), mode='constant')
-        sim = 1 - cosine(mf_p.flatten(), tpl_p.flatten())
-        if sim > best_sim:
-            best_sim = sim
-            best_start = s/float(sr)
-    if best_start is None:
+    tpl_len_frames = template.shape[1]
+    tpl_len_sec = tpl_len_frames * frame_sec
+    hop_frames = max(1, int(hop_seconds*sr/_FRAME))
+    f_start = int(search_start/frame_sec)
+    f_end = max(f_start+tpl_len_frames, int(search_end/frame_sec))
+    # Last window must still fit inside the track
+    f_stop = min(f_end, M.shape[1] - tpl_len_frames + 1)
+    if f_stop <= f_start:
         return None
-    return (best_start, best_start + tpl_len_sec, best_sim)
+    # Log-mel energies are all positive, so windows are compared by Pearson
+    # correlation (cosine of mean-centred vectors) to keep scores discriminative
+    tpl = np.asarray(template, dtype=np.float32)
+    tpl = tpl - tpl.mean()
+    sims = None
+    kernel = _sliding_correlation_kernel()
+    if kernel is not None:
+        try:
+            n_windows = len(range(f_start, f_stop, hop_frames))
+            sims = kernel(np.ascontiguousarray(M), np.ascontiguousarray(tpl), float(np.linalg.norm(tpl)), tpl_len_frames, hop_frames, f_start, n_windows)
+        except Exception:
+            sims = None
+    if sims is None:
+        # [n_bands, W, tpl] -> [W, n_bands*tpl], flattened in the same order as the template
+        view = sliding_window_view(M[:, f_start:f_stop + tpl_len_frames - 1], tpl_len_frames, axis=1)[:, ::hop_frames, :]
+        windows = view.transpose(1, 0, 2).reshape(view.shape[1], -1)
+        windows = windows - windows.mean(axis=1, keepdims=True)
+        tpl_flat = (tpl / (np.linalg.norm(tpl) + 1e-12)).ravel()
+        sims = (windows @ tpl_flat) / (np.linalg.norm(windows, axis=1) + 1e-12)
+    best = int(sims.argmax())
+    best_start = (f_start + best*hop_frames) * frame_sec
+    return (best_start, best_start + tpl_len_sec, float(sims[best]))
 
 def detect_alignment_for_files(video_files, work_dir, intro_range, outro_range):
     """Compute per-file aligned intro/outro ranges and confidence for preview."""
-    if 'terminal_output' not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    terminal = st.session_state.terminal_output
-
     results = []
-    # Build audio once
-    audio_paths = []
-    for vf in video_files:
-        ap = extract_audio_for_analysis(vf, work_dir)
-        audio_paths.append(ap)
-    intro_tpl, outro_tpl = build_intro_outro_templates([p for p in audio_paths if p], intro_range, outro_range)
+    # Duration probes run on their own pool while the audio extraction pool is busy,
+    # so the ffprobe round-trips overlap instead of running one per loop iteration
+    max_workers = max(1, min(os.cpu_count() or 1, 4, len(video_files)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+        pending_durations = ex.map(get_video_duration_seconds, video_files)
+        # Build audio and features once; templates and the offset search share them
+        audio_paths = _extract_audio_parallel(video_files, work_dir)
+        durations = [d or 0.0 for d in pending_durations]
+    features = [_cached_features(ap) if ap else None for ap in audio_paths]
+    intro_tpl, outro_tpl = build_intro_outro_templates([f for f in features if f is not None], intro_range, outro_range)
 
+    # The matching itself stays serial: the Numba kernel already spreads each search over all cores
     for idx, vf in enumerate(video_files):
-        ap = audio_paths[idx]
+        feats = features[idx]
         vf_intro = None
         vf_outro = None
         conf_i = 0.0
         conf_o = 0.0
-        dur = get_video_duration_seconds(vf) or 0.0
-        if ap and intro_tpl is not None:
-            det = detect_segment_offset(ap, intro_tpl, 0, min(180.0, dur))
+        dur = durations[idx]
+        if feats is not None and intro_tpl is not None:
+            det = detect_segment_offset(feats, intro_tpl, 0, min(180.0, dur))
             if det:
                 vf_intro = (det[0], det[1])
                 conf_i = float(det[2])
-        if ap and outro_tpl is not None:
+        if feats is not None and outro_tpl is not None:
             start_win = max(0.0, dur - 240.0)
-            det = detect_segment_offset(ap, outro_tpl, start_win, dur)
+            det = detect_segment_offset(feats, outro_tpl, start_win, dur)
             if det:
                 vf_outro = (det[0], det[1])
                 conf_o = float(det[2])
@@ -509,6 +634,201 @@ def detect_alignment_for_files(video_files, work_dir, intro_range, outro_range):
         })
     return results
 
+def _codec_family(encoder):
+    """Map an ffmpeg encoder name (hevc_nvenc, libx264, ...) to the codec_name ffprobe reports."""
+    if "265" in encoder or "hevc" in encoder:
+        return "hevc"
+    if "264" in encoder:
+        return "h264"
+    if "av1" in encoder:
+        return "av1"
+    return None
+
+def _homogeneous_video_codec(paths):
+    """Codec name shared by every file's first video stream when profile, pix_fmt, size and frame rate match too."""
+    signatures = set()
+    for path in paths:
+        data = _probe_file(path) or {}
+        video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), None)
+        if video is None:
+            return None
+        signatures.add(tuple(video.get(k) for k in ('codec_name', 'profile', 'pix_fmt', 'width', 'height', 'r_frame_rate')))
+        if len(signatures) > 1:
+            return None
+    return next(iter(signatures))[0] if signatures else None
+
+def _annexb_bsf(paths, codec_family):
+    """Bitstream filter for stream-copying H.264/HEVC when MPEG-TS inputs are mixed with MP4/MKV ones.
+
+    TS carries Annex B start codes while MP4/MKV store length-prefixed NAL units; converting
+    everything to Annex B keeps the copied stream consistent across the concat boundary.
+    """
+    if codec_family not in ("h264", "hevc"):
+        return []
+    containers = {((_probe_file(p) or {}).get('format') or {}).get('format_name') for p in paths}
+    if len(containers) > 1 and 'mpegts' in containers:
+        return ["-bsf:v", f"{codec_family}_mp4toannexb"]
+    return []
+
+def _x265_opts(quality):
+    """libx265 options: one thread pool per NUMA node, WPP plus parallel mode/ME, one thread per physical core."""
+    return [
+        "-c:v", "libx265", "-preset", "fast", "-crf", str(quality),
+        "-x265-params", "pools=+:wpp=1:pmode=1:pme=1",
+        "-threads", str(max(1, (os.cpu_count() or 2) // 2)),
+    ]
+
+def _svtav1_opts(quality):
+    """SVT-AV1 at preset 6, the balanced speed/quality point; scales across all cores."""
+    return [
+        "-c:v", "libsvtav1", "-preset", "6", "-crf", str(quality),
+        "-svtav1-params", "tune=0:enable-overlays=1", "-pix_fmt", "yuv420p10le",
+    ]
+
+def _source_bitrate(paths):
+    """Mean container bitrate of the inputs in bit/s, or None if ffprobe reports none."""
+    rates = []
+    for path in paths:
+        try:
+            rates.append(int(_probe_file(path)['format']['bit_rate']))
+        except (TypeError, KeyError, ValueError):
+            pass
+    return sum(rates) // len(rates) if rates else None
+
+def _videotoolbox_opts(encoder, quality, paths):
+    """VideoToolbox options that honour the quality setting on both Apple Silicon and Intel Macs."""
+    vt_opts = ["-prio_speed", "1", "-spatial_aq", "1", "-power_efficient", "0"]
+    if PLATFORM_CONFIG['is_apple_silicon']:
+        # Constant-quality mode is implemented by the Apple Silicon media engine only
+        return ["-c:v", encoder, "-q:v", quality, "-allow_sw", "0", *vt_opts]
+    # Intel VideoToolbox ignores -q:v, so target a fraction of the source bitrate instead
+    source = _source_bitrate(paths)
+    if source is None:
+        return ["-c:v", encoder, "-q:v", quality, *vt_opts]
+    ratio = 0.6 if _codec_family(encoder) == "hevc" else 0.9
+    return ["-c:v", encoder, "-b:v", str(int(source * ratio)), *vt_opts]
+
+def _cpu_encoder_opts(codec_family, quality):
+    """Software encoder options producing the given codec family."""
+    if codec_family == "hevc":
+        return _x265_opts(quality)
+    if codec_family == "av1":
+        return _svtav1_opts(quality)
+    return ["-c:v", "libx264", "-preset", "fast", "-crf", str(quality)]
+
+def _mux_opts(output_path, codec_family=None):
+    """MP4/MOV muxer options: moov atom up front for progressive playback, hvc1 tag for Apple players."""
+    if os.path.splitext(output_path)[1].lower() not in (".mp4", ".m4v", ".mov"):
+        return []
+    opts = ["-movflags", "+faststart"]
+    if codec_family == "hevc":
+        opts += ["-tag:v", "hvc1"]
+    return opts
+
+def _nvenc_args(codec_family, quality, paths):
+    # Decode with NVDEC straight into CUDA memory that NVENC reads without a host round-trip
+    return (["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"],
+            ["-c:v", f"{codec_family}_nvenc", "-preset", "p4", "-tune", "hq", "-rc", "vbr", "-cq", quality])
+
+def _qsv_args(codec_family, quality, paths):
+    # Decode into QSV surfaces and upload anything decoded in software
+    return (["-init_hw_device", "qsv=hw", "-filter_hw_device", "hw", "-hwaccel", "qsv", "-hwaccel_output_format", "qsv"],
+            ["-vf", "format=nv12|qsv,hwupload=extra_hw_frames=64", "-c:v", f"{codec_family}_qsv", "-preset", "veryfast", "-global_quality", quality])
+
+def _vaapi_args(codec_family, quality, paths):
+    # Keep decoded VA surfaces on the GPU; hwupload covers inputs VAAPI cannot decode
+    return (["-hwaccel", "vaapi", "-hwaccel_output_format", "vaapi", "-vaapi_device", "/dev/dri/renderD128"],
+            ["-vf", "format=nv12|vaapi,hwupload", "-c:v", f"{codec_family}_vaapi", "-qp", quality])
+
+def _videotoolbox_args(codec_family, quality, paths):
+    return ["-hwaccel", "videotoolbox"], _videotoolbox_opts(f"{codec_family}_videotoolbox", quality, paths)
+
+def _cpu_args(codec_family, quality, paths):
+    return [], _cpu_encoder_opts(codec_family, quality)
+
+# Preset backend suffix -> builder returning (input options, encoder options)
+ENCODER_BACKENDS = {
+    "nvenc": _nvenc_args,
+    "videotoolbox": _videotoolbox_args,
+    "qsv": _qsv_args,
+    "vaapi": _vaapi_args,
+    "cpu": _cpu_args,
+}
+# Order in which the auto preset tries hardware backends
+_AUTO_BACKENDS = ("nvenc", "videotoolbox", "qsv", "vaapi")
+
+def _encoder_args(preset, quality, paths, acceleration):
+    """Resolve a "<codec>_<backend>" preset (or auto/copy) to (input options, encoder options)."""
+    if preset == "auto":
+        backend = next(
+            (b for b in _AUTO_BACKENDS if acceleration[b] and (b != "videotoolbox" or PLATFORM_CONFIG['is_macos'])),
+            "cpu",
+        )
+        return ENCODER_BACKENDS[backend]("hevc", quality, paths)
+    if preset == "copy":
+        # At this point copy failed or was not possible; pick a safe re-encode
+        return _cpu_args("h264", quality, paths)
+    codec, _, backend = preset.partition("_")
+    builder = ENCODER_BACKENDS.get(backend)
+    if builder is None:
+        return _cpu_args("hevc", quality, paths)
+    return builder("hevc" if codec == "h265" else codec, quality, paths)
+
+# Log lines that mean the hardware encoder itself failed. Match VideoToolbox's session
+# errors rather than the bare word: macOS builds print --enable-videotoolbox in every banner
+_HW_FAILURE_MARKERS = (
+    'No capable devices found',
+    'OpenEncodeSessionEx failed',
+    'Failed to initialise VAAPI',
+    'Device creation failed',
+    'MFX session',
+    'cannot create compression session',
+    'Error creating compression session',
+)
+
+def _partial_path(output_path):
+    """Sibling temp name for an in-progress output; keeps the extension so ffmpeg picks the same muxer."""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.part{ext}"
+
+def _publish_output(tmp_path, output_path, result):
+    """Atomically move a finished output into place, or drop the partial file on failure."""
+    if result['success']:
+        try:
+            os.replace(tmp_path, output_path)
+        except OSError as e:
+            return {**result, 'success': False, 'stderr': f"Failed to finalize output: {e}"}
+    else:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+    return result
+
+def _rmtree_parallel(dirs):
+    """Delete the existing directories among dirs concurrently; returns the ones removed."""
+    existing = [d for d in dirs if os.path.isdir(d)]
+    if existing:
+        # unlink is I/O-bound, so separate trees overlap well on threads
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(existing)) as ex:
+            list(ex.map(lambda d: shutil.rmtree(d, ignore_errors=True), existing))
+    return existing
+
+@functools.lru_cache(maxsize=1)
+def _libc():
+    return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+def _remove_quarantine(path):
+    """Drop com.apple.quarantine with a single removexattr(2) call; raises OSError if it is not set."""
+    # CPython only exposes os.removexattr on Linux, so call the macOS libc symbol directly
+    remove = getattr(os, "removexattr", None)
+    if remove is not None:
+        remove(path, "com.apple.quarantine")
+        return
+    if _libc().removexattr(os.fsencode(path), b"com.apple.quarantine", 0) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
 def encode_videos_direct(download_dir, output_file, preset="auto", quality="25", intro_range=None, outro_range=None, per_file_align=False, cleanup_residuals=True, keep_deleted_compilation=False, only_keep_outputs=False):
     """Encode videos directly using FFmpeg commands"""
     # Ensure terminal_output exists in session state
@@ -526,7 +846,6 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
     
     # Optionally trim intro/outro per file
     processed_files = []
-    did_trim = False
     if intro_range or outro_range:
         terminal.add_line("Trimming intro/outro segments before merge...", "info")
         
@@ -534,96 +853,93 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
         if per_file_align:
             terminal.add_line("Per-episode alignment enabled: building templates...", "info")
             # Build audio paths and templates
-            audio_paths = []
-            for vf in video_files:
-                ap = extract_audio_for_analysis(vf, download_dir)
-                if ap:
-                    audio_paths.append(ap)
+            # One entry per video (None where extraction failed) so indices line up below
+            audio_paths = _extract_audio_parallel(video_files, download_dir)
+            features = [_cached_features(ap) if ap else None for ap in audio_paths]
+            valid_features = [f for f in features if f is not None]
             intro_tpl = None
             outro_tpl = None
-            if len(audio_paths) >= 1:
-                intro_tpl, outro_tpl = build_intro_outro_templates(audio_paths, intro_range, outro_range)
+            if len(valid_features) >= 1:
+                intro_tpl, outro_tpl = build_intro_outro_templates(valid_features, intro_range, outro_range)
             # For each file, detect offset for intro/outro within reasonable windows and trim
+            trim_jobs = []
             for idx, vf in enumerate(video_files):
-                ap = audio_paths[idx] if idx < len(audio_paths) else None
+                feats = features[idx]
                 ep_intro = intro_range
                 ep_outro = outro_range
-                if ap and intro_tpl is not None:
+                if feats is not None and intro_tpl is not None:
                     # Search intro in first ~180s
-                    det = detect_segment_offset(ap, intro_tpl, 0, 180)
+                    det = detect_segment_offset(feats, intro_tpl, 0, 180)
                     if det and det[2] > 0.6:
                         ep_intro = (det[0], det[1])
                         terminal.add_line(f"Aligned intro for {os.path.basename(vf)}: {ep_intro[0]:.1f}-{ep_intro[1]:.1f}", "info")
-                if ap and outro_tpl is not None:
+                if feats is not None and outro_tpl is not None:
                     # Search outro in last ~240s window
                     dur = get_video_duration_seconds(vf) or 0
                     start_win = max(0.0, dur - 240)
-                    det = detect_segment_offset(ap, outro_tpl, start_win, dur)
+                    det = detect_segment_offset(feats, outro_tpl, start_win, dur)
                     if det and det[2] > 0.6:
                         ep_outro = (det[0], det[1])
                         terminal.add_line(f"Aligned outro for {os.path.basename(vf)}: {ep_outro[0]:.1f}-{ep_outro[1]:.1f}", "info")
-                ok, outp = trim_video_remove_segments(vf, intro_range=ep_intro, outro_range=ep_outro, work_dir=download_dir, return_removed=False)
-                if not ok:
-                    return False, f"Trimming failed for {os.path.basename(vf)}: {outp}"
-                processed_files.append(outp)
-                did_trim = True
+                trim_jobs.append((vf, ep_intro, ep_outro))
         else:
-            for vf in video_files:
-                ok, outp = trim_video_remove_segments(vf, intro_range=intro_range, outro_range=outro_range, work_dir=download_dir, return_removed=False)
+            trim_jobs = [(vf, intro_range, outro_range) for vf in video_files]
+
+        # Trims are stream copies with a libx264 fallback, so they are CPU/disk bound.
+        # Pool threads have no session, so they get its terminal and stop event explicitly
+        stop_event = ensure_stop_event()
+        max_workers = max(1, min(len(trim_jobs), (os.cpu_count() or 2) // 2))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [
+                ex.submit(trim_video_remove_segments, vf, intro_range=ep_intro, outro_range=ep_outro, work_dir=download_dir,
+                          return_removed=False, terminal=terminal, stop_event=stop_event)
+                for vf, ep_intro, ep_outro in trim_jobs
+            ]
+            # Collect in submission order so the concat list keeps episode order
+            for (vf, _, _), fut in zip(trim_jobs, futures):
+                ok, outp = fut.result()
                 if not ok:
+                    for pending in futures:
+                        pending.cancel()
                     return False, f"Trimming failed for {os.path.basename(vf)}: {outp}"
                 processed_files.append(outp)
-                did_trim = True
     else:
         processed_files = video_files
     
-    # Create file list for FFmpeg concat
-    list_file = os.path.join(download_dir, "filelist.txt")
-    try:
-        with open(list_file, 'w') as f:
-            for video_file in processed_files:
-                # Escape single quotes for FFmpeg
-                escaped_file = video_file.replace("'", "'\"'\"'")
-                f.write(f"file '{escaped_file}'\n")
-    except Exception as e:
-        return False, f"Failed to create file list: {e}"
+    # Build the concat list in memory; ffmpeg reads it from stdin
+    concat_text = "".join(_concat_list_line(os.path.abspath(video_file)) for video_file in processed_files)
     
     # If preset is 'copy', try zero-reencode paths first
     if preset == "copy":
         output_path = os.path.join(download_dir, output_file)
+        tmp_path = _partial_path(output_path)
         # Single file: just copy the (possibly trimmed) file
         if len(processed_files) == 1:
             try:
-                shutil.copy2(processed_files[0], output_path)
+                shutil.copy2(processed_files[0], tmp_path)
+                os.replace(tmp_path, output_path)
                 terminal.add_line("Copied single file to output (no re-encode)", "success")
                 # Optional cleanup
                 if cleanup_residuals:
                     try:
-                        for d in [os.path.join(download_dir, "trimmed"), os.path.join(download_dir, "analysis_audio")]:
-                            if os.path.isdir(d):
-                                shutil.rmtree(d, ignore_errors=True)
+                        _rmtree_parallel([os.path.join(download_dir, "trimmed"), os.path.join(download_dir, "analysis_audio")])
                     except Exception as e:
                         terminal.add_line(f"Cleanup warning: {e}", "warning")
                 return True, ""
             except Exception as e:
+                _publish_output(tmp_path, output_path, {'success': False})
                 terminal.add_line(f"Copy failed, will try concat/encode: {e}", "warning")
         
         # Multiple files: try concat with stream copy
-        copy_cmd = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' -c copy '{output_path}'"
         terminal.add_line("Attempting concat with stream copy (-c copy)", "info")
-        copy_result = run_shell_command_with_output(copy_cmd, cwd=download_dir, timeout=3600)
+        copy_bsf = _annexb_bsf(processed_files, _homogeneous_video_codec(processed_files))
+        copy_result = run_ffmpeg(["-y", *_CONCAT_STDIN, "-c", "copy", *copy_bsf, *_mux_opts(output_path), tmp_path], timeout=3600, input_text=concat_text)
+        copy_result = _publish_output(tmp_path, output_path, copy_result)
         if copy_result['success']:
-            # Clean up list file
-            try:
-                os.remove(list_file)
-            except:
-                pass
             # Optional cleanup
             if cleanup_residuals:
                 try:
-                    for d in [os.path.join(download_dir, "trimmed"), os.path.join(download_dir, "analysis_audio")]:
-                        if os.path.isdir(d):
-                            shutil.rmtree(d, ignore_errors=True)
+                    _rmtree_parallel([os.path.join(download_dir, "trimmed"), os.path.join(download_dir, "analysis_audio")])
                 except Exception as e:
                     terminal.add_line(f"Cleanup warning: {e}", "warning")
             return True, ""
@@ -633,83 +949,65 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
     # Determine encoder based on preset and hardware
     acceleration = detect_hardware_acceleration()
     
-    if preset == "auto":
-        if acceleration['nvenc']:
-            encoder = "hevc_nvenc"
-            encoder_opts = f"-c:v {encoder} -preset fast -cq {quality}"
-        elif acceleration['videotoolbox'] and PLATFORM_CONFIG['is_macos']:
-            encoder = "hevc_videotoolbox"
-            encoder_opts = f"-hwaccel videotoolbox -c:v {encoder} -q:v {quality} -prio_speed 1 -spatial_aq 1 -power_efficient 0"
-        elif acceleration['qsv']:
-            encoder = "hevc_qsv"
-            encoder_opts = f"-c:v {encoder} -preset fast -global_quality {quality}"
-        elif acceleration['vaapi']:
-            encoder = "hevc_vaapi"
-            encoder_opts = f"-hwaccel vaapi -vaapi_device /dev/dri/renderD128 -c:v {encoder} -qp {quality}"
-        else:
-            encoder = "libx265"
-            encoder_opts = f"-c:v {encoder} -preset fast -crf {quality}"
-    elif preset == "copy":
-        # At this point copy failed or was not possible; pick a safe re-encode
-        encoder_opts = f"-c:v libx264 -preset fast -crf {quality}"
-    elif "nvenc" in preset:
-        encoder_opts = f"-c:v {preset.replace('h264_', 'h264_').replace('h265_', 'hevc_')} -preset fast -cq {quality}"
-    elif "videotoolbox" in preset:
-        if "h264" in preset:
-            encoder_opts = f"-hwaccel videotoolbox -c:v h264_videotoolbox -q:v {quality} -prio_speed 1 -spatial_aq 1 -power_efficient 0"
-        elif "h265" in preset or "hevc" in preset:
-            encoder_opts = f"-hwaccel videotoolbox -c:v hevc_videotoolbox -q:v {quality} -prio_speed 1 -spatial_aq 1 -power_efficient 0"
-        else:
-            encoder_opts = f"-hwaccel videotoolbox -c:v hevc_videotoolbox -q:v {quality} -prio_speed 1 -spatial_aq 1 -power_efficient 0"
-    elif "qsv" in preset:
-        encoder_opts = f"-c:v {preset.replace('h265_', 'hevc_')} -preset fast -global_quality {quality}"
-    elif "vaapi" in preset:
-        encoder_opts = f"-hwaccel vaapi -vaapi_device /dev/dri/renderD128 -c:v {preset.replace('h265_', 'hevc_')} -qp {quality}"
-    elif "cpu" in preset:
-        if "h264" in preset:
-            encoder_opts = f"-c:v libx264 -preset fast -crf {quality}"
-        elif "h265" in preset:
-            encoder_opts = f"-c:v libx265 -preset fast -crf {quality}"
-        elif "av1" in preset:
-            encoder_opts = f"-c:v libaom-av1 -crf {quality}"
-    else:
-        encoder_opts = f"-c:v libx265 -preset fast -crf {quality}"
+    quality = str(quality)
+    # hw_input holds input-side options (placed before -i) for hardware decode paths
+    hw_input, encoder_opts = _encoder_args(preset, quality, processed_files, acceleration)
+    
+    # Swap a hardware encoder this ffmpeg lacks (or whose device failed the probe) for
+    # its CPU equivalent now, rather than after a failed encode
+    requested = encoder_opts[encoder_opts.index("-c:v") + 1] if "-c:v" in encoder_opts else None
+    encoders = available_encoders()
+    if requested and encoders:
+        device_missing = ("nvenc" in requested and not acceleration['nvenc']) or ("videotoolbox" in requested and not acceleration['videotoolbox'])
+        if requested not in encoders or device_missing:
+            hw_input = []
+            encoder_opts = _cpu_encoder_opts(_codec_family(requested), quality)
+            terminal.add_line(f"{requested} is not usable here; encoding with {encoder_opts[1]} instead", "warning")
     
     # Build FFmpeg command
     output_path = os.path.join(download_dir, output_file)
+    # ffmpeg writes to a sibling temp file that is renamed into place only on success
+    tmp_path = _partial_path(output_path)
+    concat_in = ["-y", *_CONCAT_STDIN]
     
-    # For VideoToolbox, hwaccel needs to come before input
-    if "videotoolbox" in encoder_opts:
-        # Use Metal-optimized VideoToolbox with additional GPU acceleration
-        cmd = f"ffmpeg -y -hwaccel videotoolbox -f concat -safe 0 -i '{list_file}' {encoder_opts.replace('-hwaccel videotoolbox ', '')} -c:a copy -threads 0 '{output_path}'"
-    else:
-        cmd = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' {encoder_opts} -c:a copy '{output_path}'"
+    target_codec = _codec_family(encoder_opts[encoder_opts.index("-c:v") + 1]) if "-c:v" in encoder_opts else None
+    
+    # hwaccel options must come before the input they apply to
+    args = ["-y", *hw_input, *concat_in[1:], *encoder_opts, "-c:a", "copy", *_mux_opts(output_path, target_codec), tmp_path]
     
-    terminal.add_line(f"Using encoder: {encoder_opts}", "info")
     terminal.add_line(f"Output file: {output_path}", "info")
     
-    # Run FFmpeg
-    result = run_shell_command_with_output(cmd, cwd=download_dir, timeout=3600)
+    # Inputs that already share the target codec and parameters only need joining
+    result = None
+    if target_codec and _homogeneous_video_codec(processed_files) == target_codec:
+        terminal.add_line(f"All inputs are already {target_codec} with matching parameters; joining with stream copy", "info")
+        result = run_ffmpeg([*concat_in, "-c", "copy", *_annexb_bsf(processed_files, target_codec), *_mux_opts(output_path, target_codec), tmp_path], timeout=3600, input_text=concat_text)
+        if not result['success']:
+            terminal.add_line("Stream copy join failed; re-encoding instead", "warning")
+            result = None
     
-    # If hardware acceleration failed, try CPU fallback
-    if not result['success'] and ('No capable devices found' in result['stderr'] or 'OpenEncodeSessionEx failed' in result['stderr'] or 'videotoolbox' in result['stderr'].lower()):
+    if result is None:
+        terminal.add_line(f"Using encoder: {shlex.join(hw_input + encoder_opts)}", "info")
+        # Software encoders are compute-bound; keep their threads on distinct physical cores
+        affinity = _physical_cores() if not hw_input else None
+        result = run_ffmpeg(args, timeout=3600, input_text=concat_text, cpu_affinity=affinity)
+    
+    # If hardware acceleration failed, try CPU fallback (ffmpeg's stderr is merged into stdout)
+    log = result['stdout'] + result['stderr']
+    if not result['success'] and any(marker in log for marker in _HW_FAILURE_MARKERS):
         terminal.add_line("Hardware acceleration failed, trying CPU fallback...", "warning")
         
         # Fallback to CPU encoding
         if preset == "auto" or "nvenc" in preset or "qsv" in preset or "vaapi" in preset or "videotoolbox" in preset:
             if "h264" in preset or preset == "auto":
-                fallback_cmd = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' -c:v libx264 -preset fast -crf {quality} -c:a copy '{output_path}'"
+                fallback_args = [*concat_in, "-c:v", "libx264", "-preset", "fast", "-crf", quality, "-c:a", "copy", *_mux_opts(output_path), tmp_path]
             else:
-                fallback_cmd = f"ffmpeg -y -f concat -safe 0 -i '{list_file}' -c:v libx265 -preset fast -crf {quality} -c:a copy '{output_path}'"
+                fallback_args = [*concat_in, *_x265_opts(quality), "-c:a", "copy", *_mux_opts(output_path, "hevc"), tmp_path]
             
-            terminal.add_line(f"Fallback command: {fallback_cmd}", "info")
-            result = run_shell_command_with_output(fallback_cmd, cwd=download_dir, timeout=3600)
+            terminal.add_line(f"Fallback command: ffmpeg {shlex.join(fallback_args)}", "info")
+            result = run_ffmpeg(fallback_args, timeout=3600, input_text=concat_text, cpu_affinity=_physical_cores())
     
-    # Clean up list file (keep trimmed parts for reuse)
-    try:
-        os.remove(list_file)
-    except:
-        pass
+    result = _publish_output(tmp_path, output_path, result)
     
     # If requested, compile deleted parts into a single deleted.mp4 in the download_dir
     deleted_path = None
@@ -722,10 +1020,8 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
                 os.path.join(download_dir, "analysis_audio"),
                 os.path.join(download_dir, "removed"),
             ]
-            for d in tmp_dirs:
-                if os.path.isdir(d):
-                    terminal.add_line(f"Removing temporary directory: {d}", "info")
-                    shutil.rmtree(d, ignore_errors=True)
+            for d in _rmtree_parallel(tmp_dirs):
+                terminal.add_line(f"Removed temporary directory: {d}", "info")
         except Exception as e:
             terminal.add_line(f"Cleanup warning: {e}", "warning")
     
@@ -735,14 +1031,15 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
             keep_set = {os.path.join(download_dir, output_file)}
             if deleted_path:
                 keep_set.add(deleted_path)
-            for entry in os.listdir(download_dir):
-                p = os.path.join(download_dir, entry)
-                if os.path.isfile(p) and p not in keep_set and entry.lower().endswith(VIDEO_EXTENSIONS):
-                    terminal.add_line(f"Removing source video: {entry}", "info")
-                    try:
-                        os.remove(p)
-                    except Exception:
-                        pass
+            # DirEntry carries the type from readdir, so no extra stat per file
+            with os.scandir(download_dir) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1].lower() in _VIDEO_EXT_SET and entry.path not in keep_set:
+                        terminal.add_line(f"Removing source video: {entry.name}", "info")
+                        try:
+                            os.unlink(entry.path)
+                        except Exception:
+                            pass
         except Exception as e:
             terminal.add_line(f"Final outputs retention warning: {e}", "warning")
     
@@ -751,10 +1048,10 @@ def encode_videos_direct(download_dir, output_file, preset="auto", quality="25",
         output_path = os.path.join(download_dir, output_file)
         if os.path.exists(output_path):
             try:
-                subprocess.run(f"xattr -d com.apple.quarantine '{output_path}'", shell=True, capture_output=True)
+                _remove_quarantine(output_path)
                 terminal.add_line("🔓 Removed macOS quarantine attribute", "info")
-            except:
-                pass  # Ignore if xattr fails
+            except Exception:
+                pass  # Not quarantined, or the filesystem has no xattrs
     
     return result['success'], result['stderr']
 
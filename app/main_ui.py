@@ -1,23 +1,38 @@
 """
 Streamlit UI: main page and layout.
 """
-import asyncio
+import concurrent.futures
+import functools
 import os
-import subprocess
+import shutil
+import signal
+import threading
+import time
 
+import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from .config import BASE_DOWNLOAD_DIR, VIDEO_EXTENSIONS
-from .path_utils import get_base_download_dir, get_folder_name_from_url, is_youtube_url, ensure_download_dir
-from .shell_utils import TerminalOutput, check_command_exists, ensure_terminal, run_shell_command
+from .path_utils import get_base_download_dir, get_folder_name_from_url, is_youtube_url, ensure_download_dir, local_playlist
+from .shell_utils import (
+    ensure_stop_event,
+    ensure_terminal,
+    run_on_background_loop,
+    run_shell_command,
+    signal_processes,
+    terminate_processes,
+    which_many,
+)
 from .platform_utils import PLATFORM_CONFIG
 from .prerequisites import install_prerequisites, install_torrent_options, detect_hardware_acceleration
 from .download import (
     fetch_video_links,
+    FileStatus,
+    StatusBoard,
     download_all_files,
     prepare_streaming_urls,
     stream_all_in_vlc,
-    start_torrent_download_with_aria2,
     stream_torrent_via_webtorrent,
 )
 from .encoding import (
@@ -26,8 +41,287 @@ from .encoding import (
     get_video_info,
     encode_videos_direct,
     encode_videos_shell,
+    auto_detect_intro_outro,
+    detect_alignment_for_files,
+)
+from .torrent import (
+    ARIA2_CLI_PATTERN,
+    is_torrent_link,
+    collect_torrent_video_files,
+    control_torrents,
+    save_uploaded_torrent,
+    start_torrent_download_with_aria2,
+)
+
+
+# Read-only stand-in for files the workers have not reported on yet
+_NO_STATUS = FileStatus('-')
+# Statuses that count toward "successful" in the progress bar
+_COMPLETED_SET = frozenset(('completed', 'already downloaded'))
+
+
+# Custom CSS for better UI/UX plus the main header, built once at import
+_PAGE_CHROME = """
+<style>
+.main-header {
+    background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
+    padding: 2rem;
+    border-radius: 10px;
+    margin-bottom: 2rem;
+    text-align: center;
+    color: white;
+}
+.main-header h1 {
+    margin: 0;
+    font-size: 2.5rem;
+    font-weight: bold;
+}
+.main-header p {
+    margin: 0.5rem 0 0 0;
+    font-size: 1.2rem;
+    opacity: 0.9;
+}
+.status-card {
+    background: #f8f9fa;
+    padding: 1rem;
+    border-radius: 8px;
+    border-left: 4px solid #007bff;
+    margin: 1rem 0;
+}
+.file-item {
+    background: #f8f9fa;
+    padding: 0.8rem;
+    margin: 0.5rem 0;
+    border-radius: 6px;
+    border-left: 3px solid #28a745;
+}
+.terminal-container {
+    background: #1e1e1e;
+    color: #ffffff;
+    padding: 15px;
+    border-radius: 8px;
+    font-family: 'Courier New', monospace;
+    font-size: 14px;
+    line-height: 1.4;
+    max-height: 400px;
+    overflow-y: auto;
+    border: 1px solid #333;
+}
+.stButton > button {
+    background: linear-gradient(45deg, #667eea, #764ba2);
+    color: white;
+    border: none;
+    border-radius: 6px;
+    padding: 0.5rem 1rem;
+    font-weight: bold;
+    transition: all 0.3s ease;
+}
+.stButton > button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 4px 12px rgba(0,0,0,0.2);
+}
+</style>
+<div class="main-header">
+    <h1>📥 Streamlit Download Manager</h1>
+    <p>Advanced video downloading with shell integration and real-time progress tracking</p>
+</div>
+"""
+
+
+SYSTEM_COMMANDS = ('ffmpeg', 'wget', 'curl', 'yt-dlp', 'aria2c', 'webtorrent')
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_check_cmds(commands):
+    """Availability of each command; cached so reruns do not re-probe PATH."""
+    return which_many(commands)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_hwaccel():
+    """Hardware acceleration probe (runs ffmpeg test encodes), shared across reruns."""
+    return detect_hardware_acceleration()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _sudo_needs_password():
+    """Whether sudo would prompt; re-checked at most every 30s instead of on every rerun."""
+    return not run_shell_command(["sudo", "-n", "true"], timeout=5)['success']
+
+
+# (acceleration key, preset names, label) in the order the encoding panel lists them
+_HW_ENCODERS = (
+    ('nvenc', ("h264_nvenc", "h265_nvenc"), "🚀 NVIDIA NVENC"),
+    ('qsv', ("h264_qsv", "h265_qsv"), "⚡ Intel QSV"),
+    ('vaapi', ("h264_vaapi", "h265_vaapi"), "🔧 VA-API"),
+    ('videotoolbox', ("h264_videotoolbox", "h265_videotoolbox"), "🍎 VideoToolbox + Metal GPU (macOS)"),
 )
-from .torrent import is_torrent_link, collect_torrent_video_files
+
+
+def _usable_backends(acceleration):
+    """Acceleration keys the encoding panel may offer; VideoToolbox only counts on macOS."""
+    return frozenset(
+        key for key, ok in acceleration.items()
+        if ok and (key != 'videotoolbox' or PLATFORM_CONFIG['is_macos'])
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _encoder_menu(backends):
+    """(preset options, encoder labels) for a set of usable backends."""
+    presets = ["auto", "copy"]
+    labels = []
+    for key, names, label in _HW_ENCODERS:
+        if key in backends:
+            presets.extend(names)
+            labels.append(label)
+    presets.extend(["h264_cpu", "h265_cpu"])
+    labels.append("🖥️ CPU")
+    return tuple(presets), tuple(labels)
+
+
+# Commands install_prerequisites provides, with the flag that prints their version
+_PREREQ_VERSION_ARGS = {
+    'ffmpeg': '-version', 'wget': '--version', 'curl': '--version', 'aria2c': '--version',
+    'node': '--version', 'npm': '--version', 'yt-dlp': '--version', 'webtorrent': '--version',
+}
+# Query that exits non-zero unless every named package is installed; covers the
+# libraries and pip/venv packages that install no command of their own
+_PACKAGE_QUERY = {'apt': ['dpkg', '-s'], 'dnf': ['rpm', '-q'], 'pacman': ['pacman', '-Q']}
+
+
+@st.cache_resource(ttl=3600)
+def _install_fingerprint():
+    """First line of each prerequisite's version banner, or '' when it is missing."""
+    fingerprint = {}
+    for cmd, flag in _PREREQ_VERSION_ARGS.items():
+        result = run_shell_command([cmd, flag], timeout=5)
+        banner = result['stdout'].strip() if result['success'] else ''
+        fingerprint[cmd] = banner.splitlines()[0][:40] if banner else ''
+    query = _PACKAGE_QUERY.get(PLATFORM_CONFIG['package_manager'])
+    if query:
+        packages = PLATFORM_CONFIG['system_packages']
+        installed = run_shell_command([*query, *packages], timeout=10)['success']
+        fingerprint['packages'] = f"{len(packages)} system packages" if installed else ''
+    return fingerprint
+
+
+@st.cache_resource
+def _install_executor():
+    """One worker shared by every session so package-manager runs never overlap."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="install")
+
+
+def _submit_install(fn, *args):
+    """Run an installer off the script thread, keeping this session's context for session_state and the terminal."""
+    ctx = get_script_run_ctx()
+
+    def _run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    return _install_executor().submit(_run)
+
+
+def _take_install_result(future_key):
+    """Pop a finished install future and return (done, success)."""
+    fut = st.session_state.get(future_key)
+    if fut is None or not fut.done():
+        return False, False
+    del st.session_state[future_key]
+    try:
+        return True, bool(fut.result())
+    except Exception as e:
+        st.error(f"Installation failed: {e}")
+        return True, False
+
+
+def _poll_install(future_key, label):
+    """Fragment body: show install progress and rerun the page once the worker finishes."""
+    fut = st.session_state.get(future_key)
+    if fut is None:
+        return
+    if fut.done():
+        st.rerun()
+    st.info(f"⏳ {label}... {ensure_terminal().command_count} commands run so far (see Terminal Output)")
+
+
+_KB = 1 << 10
+_MB = 1 << 20
+
+
+def _fmt_speed(speed):
+    if speed > _MB:
+        return f"{speed / _MB:.1f} MB/s"
+    if speed > _KB:
+        return f"{speed / _KB:.1f} KB/s"
+    return f"{speed:.1f} B/s"
+
+
+def _fmt_eta(eta):
+    if eta < 60:
+        return f"{int(eta)}s"
+    if eta < 3600:
+        return f"{int(eta / 60)}m {int(eta % 60)}s"
+    return f"{int(eta / 3600)}h {int((eta % 3600) / 60)}m"
+
+
+def _fmt_size(size):
+    if size > _MB:
+        return f"{size / _MB:.1f} MB"
+    if size > _KB:
+        return f"{size / _KB:.1f} KB"
+    return f"{size} B"
+
+
+def _wait_for_progress(changed, busy, fallback):
+    """Block until a worker reports new state or a timeout passes."""
+    if changed is None:
+        time.sleep(fallback)
+        return
+    # Short timeout while bytes are flowing, longer when everything is queued;
+    # capped at 1s so button clicks still interrupt the run promptly
+    changed.wait(timeout=0.2 if busy else 1.0)
+
+
+def _terminal_html(lines):
+    """Wrap formatted terminal lines in the dark console panel."""
+    return f"""
+        <div style="
+            background-color: #1e1e1e;
+            color: #ffffff;
+            padding: 15px;
+            border-radius: 8px;
+            font-family: 'Courier New', monospace;
+            font-size: 14px;
+            line-height: 1.4;
+            max-height: 400px;
+            overflow-y: auto;
+            border: 1px solid #333;
+            white-space: pre-wrap;
+        ">
+        {''.join(lines)}
+        </div>
+        """
+
+
+def _render_terminal_output():
+    """Draw the terminal panel; runs as a fragment so auto-refresh repaints only this block."""
+    # Get terminal output (ensure terminal is initialized first)
+    terminal = ensure_terminal()
+    # Rebuild the HTML only when new lines arrived since the last paint
+    cached = st.session_state.get('_term_html')
+    if cached is not None and cached[0] is terminal and cached[1] == terminal.revision:
+        terminal_html = cached[2]
+    else:
+        terminal_output = terminal.get_tail(500)
+        terminal_html = _terminal_html(terminal_output) if terminal_output else None
+        st.session_state['_term_html'] = (terminal, terminal.revision, terminal_html)
+    
+    if terminal_html:
+        st.markdown(terminal_html, unsafe_allow_html=True)
+    else:
+        st.info("No terminal output yet. Run commands to see output here.")
 
 
 def main():
@@ -38,87 +332,12 @@ def main():
         page_icon="📥"
     )
     
-    # Custom CSS for better UI/UX
-    st.markdown("""
-    <style>
-    .main-header {
-        background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-        padding: 2rem;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-        text-align: center;
-        color: white;
-    }
-    .main-header h1 {
-        margin: 0;
-        font-size: 2.5rem;
-        font-weight: bold;
-    }
-    .main-header p {
-        margin: 0.5rem 0 0 0;
-        font-size: 1.2rem;
-        opacity: 0.9;
-    }
-    .status-card {
-        background: #f8f9fa;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #007bff;
-        margin: 1rem 0;
-    }
-    .progress-container {
-        background: #ffffff;
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        margin: 1rem 0;
-    }
-    .file-item {
-        background: #f8f9fa;
-        padding: 0.8rem;
-        margin: 0.5rem 0;
-        border-radius: 6px;
-        border-left: 3px solid #28a745;
-    }
-    .terminal-container {
-        background: #1e1e1e;
-        color: #ffffff;
-        padding: 15px;
-        border-radius: 8px;
-        font-family: 'Courier New', monospace;
-        font-size: 14px;
-        line-height: 1.4;
-        max-height: 400px;
-        overflow-y: auto;
-        border: 1px solid #333;
-    }
-    .stButton > button {
-        background: linear-gradient(45deg, #667eea, #764ba2);
-        color: white;
-        border: none;
-        border-radius: 6px;
-        padding: 0.5rem 1rem;
-        font-weight: bold;
-        transition: all 0.3s ease;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Main header
-    st.markdown("""
-    <div class="main-header">
-        <h1>📥 Streamlit Download Manager</h1>
-        <p>Advanced video downloading with shell integration and real-time progress tracking</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # Styles and header go out as one element; Streamlit drops anything not re-emitted on a rerun
+    st.markdown(_PAGE_CHROME, unsafe_allow_html=True)
     
     # Initialize session state
     if 'file_status' not in st.session_state:
-        st.session_state['file_status'] = {}
+        st.session_state['file_status'] = StatusBoard()
     if 'video_files' not in st.session_state:
         st.session_state['video_files'] = []
     if 'selected_files' not in st.session_state:
@@ -130,14 +349,17 @@ def main():
     
     # Run torrent-only install if user clicked "Install torrent options" (e.g. when webtorrent was missing)
     if st.session_state.get('install_torrent_options_started', False):
-        if 'terminal_output' not in st.session_state:
-            st.session_state.terminal_output = TerminalOutput()
-        with st.spinner("Installing torrent options (Node.js + webtorrent-cli)..."):
-            ok = install_torrent_options(st.session_state.terminal_output)
         st.session_state['install_torrent_options_started'] = False
+        if 'torrent_install_future' not in st.session_state:
+            st.session_state['torrent_install_future'] = _submit_install(install_torrent_options, ensure_terminal())
+    done, ok = _take_install_result('torrent_install_future')
+    if done:
+        _cached_check_cmds.clear()
+        _install_fingerprint.clear()
         if ok:
             st.success("Torrent options installed. Try streaming again.")
-        st.rerun()
+    elif 'torrent_install_future' in st.session_state:
+        st.fragment(run_every=2)(_poll_install)('torrent_install_future', "Installing torrent options (Node.js + webtorrent-cli)")
     
     # Header controls
     col_head_left, col_head_right = st.columns([3, 1])
@@ -168,13 +390,11 @@ def main():
         with col1:
             if st.button("Check System"):
                 st.write("**System Commands:**")
-                commands = ['ffmpeg', 'wget', 'curl', 'yt-dlp', 'aria2c', 'webtorrent']
-                for cmd in commands:
-                    available = check_command_exists(cmd)
+                for cmd, available in _cached_check_cmds(SYSTEM_COMMANDS).items():
                     st.write(f"- {cmd}: {'✓' if available else '✗'}")
                 
                 st.write("**Hardware Acceleration:**")
-                acceleration = detect_hardware_acceleration()
+                acceleration = _cached_hwaccel()
                 st.write(f"- NVIDIA NVENC: {'✓' if acceleration['nvenc'] else '✗'}")
                 st.write(f"- Intel QSV: {'✓' if acceleration['qsv'] else '✗'}")
                 st.write(f"- VA-API: {'✓' if acceleration['vaapi'] else '✗'}")
@@ -184,8 +404,7 @@ def main():
         
         with col2:
             # Check if we need password first
-            sudo_check = run_shell_command("sudo -n true", timeout=5)
-            needs_password = not sudo_check['success']
+            needs_password = _sudo_needs_password()
             
             if needs_password and 'installation_started' not in st.session_state:
                 # Show password input first
@@ -235,15 +454,29 @@ def main():
                     st.session_state['installation_started'] = True
                     st.rerun()
             
-            # Run installation if started
+            # Run installation if started; the worker thread keeps the page responsive
             if st.session_state.get('installation_started', False):
-                with st.spinner("Installing prerequisites..."):
-                    success = install_prerequisites()
-                    st.session_state['installation_started'] = False
-                    if 'sudo_password' in st.session_state:
-                        del st.session_state['sudo_password']
-                    if success:
-                        st.balloons()  # Celebration on success!
+                st.session_state['installation_started'] = False
+                fingerprint = _install_fingerprint()
+                if all(fingerprint.values()):
+                    # Everything is already on PATH; skip the package-manager run
+                    st.session_state.pop('sudo_password', None)
+                    st.success("All prerequisites are already installed: " + ", ".join(fingerprint.values()))
+                elif 'install_future' not in st.session_state:
+                    ensure_terminal()
+                    st.session_state['install_future'] = _submit_install(install_prerequisites)
+            done, success = _take_install_result('install_future')
+            if done:
+                # Newly installed tools and drivers invalidate the cached probes
+                _cached_check_cmds.clear()
+                _cached_hwaccel.clear()
+                _install_fingerprint.clear()
+                if 'sudo_password' in st.session_state:
+                    del st.session_state['sudo_password']
+                if success:
+                    st.balloons()  # Celebration on success!
+            elif 'install_future' in st.session_state:
+                st.fragment(run_every=2)(_poll_install)('install_future', "Installing prerequisites")
         
         # Terminal Output Display
         st.markdown("### 📺 Terminal Output")
@@ -264,43 +497,8 @@ def main():
         with col_auto:
             auto_refresh = st.checkbox("🔄 Auto-refresh (2s)", value=True, help="Automatically refresh terminal every 2 seconds")
         
-        # Get terminal output (ensure terminal is initialized first)
-        terminal = ensure_terminal()
-        terminal_output = terminal.get_output()
-        
-        if terminal_output:
-            # Create a styled terminal display
-            terminal_html = f"""
-            <div style="
-                background-color: #1e1e1e;
-                color: #ffffff;
-                padding: 15px;
-                border-radius: 8px;
-                font-family: 'Courier New', monospace;
-                font-size: 14px;
-                line-height: 1.4;
-                max-height: 400px;
-                overflow-y: auto;
-                border: 1px solid #333;
-                white-space: pre-wrap;
-            ">
-            {''.join(terminal_output)}
-            </div>
-            """
-            st.markdown(terminal_html, unsafe_allow_html=True)
-        else:
-            st.info("No terminal output yet. Run commands to see output here.")
-        
-        # Auto-refresh if enabled
-        if auto_refresh and terminal_output:
-            import time
-            if 'last_terminal_refresh' not in st.session_state:
-                st.session_state['last_terminal_refresh'] = time.time()
-            
-            current_time = time.time()
-            if current_time - st.session_state['last_terminal_refresh'] > 2:
-                st.session_state['last_terminal_refresh'] = current_time
-                st.rerun()
+        # Only the terminal fragment reruns on the timer, not the whole page
+        st.fragment(run_every=2 if auto_refresh else None)(_render_terminal_output)()
     
     # Download location
     with st.expander("Download Location", expanded=False):
@@ -316,6 +514,9 @@ def main():
                 os.makedirs(st.session_state['base_download_dir'], exist_ok=True)
                 st.success(f"Base directory set to {st.session_state['base_download_dir']}")
     
+    # Resolved once per rerun, after the location buttons above may have changed it
+    base_dir = get_base_download_dir()
+    
     # Torrent download section
     with st.expander("Torrent Download (magnet or .torrent URL)", expanded=False):
         torrent_url = st.text_input("Torrent / magnet link:", "", key="torrent_url_input")
@@ -332,7 +533,6 @@ def main():
             help="If provided, the uploaded .torrent file will be saved and used for downloading."
         )
         # Compute current target directory for reuse below
-        base_dir = get_base_download_dir()
         default_torrent_dir = os.path.join(base_dir, torrent_folder)
         st.info(f"📂 Torrent files will be saved under: `{default_torrent_dir}`")
         if st.button("Start Torrent Download", key="start_torrent_download"):
@@ -340,7 +540,7 @@ def main():
                 st.warning("Please enter a torrent or magnet link.")
             else:
                 os.makedirs(default_torrent_dir, exist_ok=True)
-                if not check_command_exists("aria2c"):
+                if not _cached_check_cmds(SYSTEM_COMMANDS)['aria2c']:
                     st.error("The aria2c command is required for torrent downloads. For example on macOS: brew install aria2.")
                 else:
                     started = start_torrent_download_with_aria2(torrent_url, default_torrent_dir)
@@ -350,15 +550,12 @@ def main():
             if not uploaded_torrent:
                 st.warning("Please select a .torrent file first.")
             else:
-                os.makedirs(default_torrent_dir, exist_ok=True)
-                local_torrent_path = os.path.join(default_torrent_dir, uploaded_torrent.name)
                 try:
-                    with open(local_torrent_path, "wb") as f:
-                        f.write(uploaded_torrent.getbuffer())
+                    local_torrent_path = save_uploaded_torrent(uploaded_torrent, default_torrent_dir)
                 except Exception as e:
                     st.error(f"Failed to save uploaded .torrent file: {e}")
                 else:
-                    if not check_command_exists("aria2c"):
+                    if not _cached_check_cmds(SYSTEM_COMMANDS)['aria2c']:
                         st.error("The aria2c command is required for torrent downloads. For example on macOS: brew install aria2.")
                     else:
                         started = start_torrent_download_with_aria2(local_torrent_path, default_torrent_dir)
@@ -369,9 +566,8 @@ def main():
         with col_t_pause:
             if st.button("⏸️ Pause Torrent Activity", key="pause_torrent_downloads"):
                 try:
-                    import subprocess as _sp
-                    _sp.run(["pkill", "-STOP", "aria2c"], check=False)
-                    _sp.run(["pkill", "-STOP", "webtorrent"], check=False)
+                    control_torrents("pause")
+                    signal_processes(signal.SIGSTOP, names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                     st.session_state['torrent_paused'] = True
                     st.info("Requested pause of aria2c/webtorrent torrent activity.")
                 except Exception:
@@ -379,9 +575,8 @@ def main():
         with col_t_resume:
             if st.button("▶️ Resume Torrent Activity", key="resume_torrent_downloads"):
                 try:
-                    import subprocess as _sp
-                    _sp.run(["pkill", "-CONT", "aria2c"], check=False)
-                    _sp.run(["pkill", "-CONT", "webtorrent"], check=False)
+                    control_torrents("resume")
+                    signal_processes(signal.SIGCONT, names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                     st.session_state['torrent_paused'] = False
                     st.info("Requested resume of aria2c/webtorrent torrent activity.")
                 except Exception:
@@ -390,31 +585,21 @@ def main():
             # Dedicated control to stop any running torrent downloads/streams
             if st.button("⏹️ Stop Torrent Downloads", key="stop_torrent_downloads"):
                 # Signal stop to any shell-based downloads
-                st.session_state['stop_downloads'] = True
+                ensure_stop_event().set()
                 try:
-                    import subprocess as _sp, time as _t
-                    _sp.run(["pkill", "-TERM", "aria2c"], check=False)
-                    _t.sleep(0.2)
-                    _sp.run(["pkill", "-KILL", "aria2c"], check=False)
-                    _sp.run(["pkill", "-TERM", "webtorrent"], check=False)
-                    _t.sleep(0.2)
-                    _sp.run(["pkill", "-KILL", "webtorrent"], check=False)
+                    control_torrents("remove")
+                    terminate_processes(names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                 except Exception:
                     pass
                 st.info("Requested termination of aria2c/webtorrent torrent activity. Check the Terminal Output for confirmation.")
 
         # Stop torrents and delete all torrent data for the configured folder
         if st.button("🧹 Stop & Delete Torrent Data", key="stop_delete_torrent_data"):
-            st.session_state['stop_downloads'] = True
+            ensure_stop_event().set()
             # First, stop any running torrent processes
             try:
-                import subprocess as _sp, time as _t
-                _sp.run(["pkill", "-TERM", "aria2c"], check=False)
-                _t.sleep(0.2)
-                _sp.run(["pkill", "-KILL", "aria2c"], check=False)
-                _sp.run(["pkill", "-TERM", "webtorrent"], check=False)
-                _t.sleep(0.2)
-                _sp.run(["pkill", "-KILL", "webtorrent"], check=False)
+                control_torrents("remove")
+                terminate_processes(names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
             except Exception:
                 pass
             # Then remove all files under the torrent folder (but keep the folder itself)
@@ -431,21 +616,11 @@ def main():
                 st.warning("No torrent download directory found yet. Start a torrent download first.")
             else:
                 # Collect all video files under the torrent folder (recursive search)
-                video_paths = []
-                try:
-                    for root, dirs, files_in_dir in os.walk(default_torrent_dir):
-                        for entry in files_in_dir:
-                            if entry.lower().endswith(VIDEO_EXTENSIONS):
-                                full = os.path.join(root, entry)
-                                if os.path.isfile(full):
-                                    video_paths.append(full)
-                except Exception:
-                    video_paths = []
+                video_paths = collect_torrent_video_files(default_torrent_dir, VIDEO_EXTENSIONS)
                 if not video_paths:
                     st.warning("No video files found in the torrent download folder yet.")
                 else:
-                    names = [os.path.relpath(p, default_torrent_dir) for p in video_paths]
-                    urls = [Path(os.path.abspath(p)).as_uri() for p in video_paths]
+                    names, urls = local_playlist(video_paths, default_torrent_dir)
                     try:
                         stream_all_in_vlc(urls, names)
                         st.success(f"Launched VLC with {len(urls)} torrent video file(s) from {default_torrent_dir}.")
@@ -460,11 +635,8 @@ def main():
                 torrent_ref = torrent_url.strip()
             elif uploaded_torrent:
                 # Save the uploaded .torrent if not already saved, then use its path
-                os.makedirs(default_torrent_dir, exist_ok=True)
-                local_torrent_path = os.path.join(default_torrent_dir, uploaded_torrent.name)
                 try:
-                    with open(local_torrent_path, "wb") as f:
-                        f.write(uploaded_torrent.getbuffer())
+                    local_torrent_path = save_uploaded_torrent(uploaded_torrent, default_torrent_dir)
                     torrent_ref = local_torrent_path
                 except Exception as e:
                     st.error(f"Failed to save uploaded .torrent file for streaming: {e}")
@@ -482,11 +654,18 @@ def main():
     if st.button("Fetch Video List") or 'video_files' not in st.session_state:
         if url:
             with st.spinner("Fetching video list..."):
-                files, playlist_title = asyncio.run(fetch_video_links(url, audio_only, playlist_limit if playlist_limit > 0 else None))
+                # Errors surface here: st.* calls on the background loop reach no session
+                try:
+                    files, playlist_title = run_on_background_loop(fetch_video_links(url, audio_only, playlist_limit if playlist_limit > 0 else None))
+                except Exception as e:
+                    st.error(f"Failed to fetch video list: {e}")
+                    files, playlist_title = [], None
                 st.session_state['video_files'] = files
+                st.session_state['_files_by_name'] = {f['name']: f for f in files}
                 st.session_state['selected_files'] = []
+                st.session_state['_selector_base'] = set()
                 st.session_state['current_folder'] = get_folder_name_from_url(url, playlist_title)
-                st.session_state['file_status'] = {}
+                st.session_state['file_status'] = StatusBoard()
                 st.session_state['is_downloading'] = False
                 st.session_state['playlist_title'] = playlist_title
                 st.session_state['current_url'] = url
@@ -500,48 +679,54 @@ def main():
     # Show playlist info
     if playlist_title and 'current_url' in st.session_state and is_youtube_url(st.session_state['current_url']):
         st.success(f"📁 Playlist: {playlist_title}")
-        st.info(f"📂 Downloads will go to: {os.path.join(get_base_download_dir(), current_folder)}")
+        st.info(f"📂 Downloads will go to: {os.path.join(base_dir, current_folder)}")
     
     # File selection
     if files:
         st.success(f"Found {len(files)} video files.")
-        st.info(f"Downloads will go to: {os.path.join(get_base_download_dir(), current_folder)}")
+        st.info(f"Downloads will go to: {os.path.join(base_dir, current_folder)}")
         
         # Initialize selected files if not exists
         if 'selected_files' not in st.session_state:
             st.session_state['selected_files'] = []
         
+        names = [f['name'] for f in files]
+        # The table is built from a baseline selection that only the buttons below (or a
+        # new fetch) replace; checkbox edits live in the editor's own state on top of it
+        if '_selector_base' not in st.session_state:
+            st.session_state['_selector_base'] = set(st.session_state['selected_files'])
+        
         # Select all/none buttons
         col_select, col_deselect = st.columns([1, 1])
         with col_select:
             if st.button("Select All", key="select_all_files"):
-                st.session_state['selected_files'] = [f['name'] for f in files]
-                # Keep the multiselect widget in sync so `selected` is populated
-                st.session_state['file_selector'] = st.session_state['selected_files']
-                st.rerun()
+                st.session_state['_selector_base'] = set(names)
+                # A fresh editor key drops the per-row edits made on the old baseline
+                st.session_state['_selector_rev'] = st.session_state.get('_selector_rev', 0) + 1
         with col_deselect:
             if st.button("Deselect All", key="deselect_all_files"):
-                st.session_state['selected_files'] = []
-                # Clear the multiselect widget state as well
-                st.session_state['file_selector'] = []
-                st.rerun()
+                st.session_state['_selector_base'] = set()
+                st.session_state['_selector_rev'] = st.session_state.get('_selector_rev', 0) + 1
         
-        # File multiselect with better state management
-        def on_selection_change():
-            # This callback ensures the session state is updated immediately
-            st.session_state['selected_files'] = st.session_state['file_selector']
+        # No st.rerun() above: the table is created below, so it picks up the
+        # new baseline in this same run
         
-        selected = st.multiselect(
-            "Select files to download or stream:",
-            options=[f['name'] for f in files],
-            default=st.session_state.get('selected_files', []),
-            key='file_selector',
-            on_change=on_selection_change
+        # Checkbox table: the grid is virtualized, so only visible rows are drawn in the browser
+        base = st.session_state['_selector_base']
+        edited = st.data_editor(
+            pd.DataFrame({'select': [n in base for n in names], 'name': names}),
+            column_config={
+                'select': st.column_config.CheckboxColumn("Select", width="small"),
+                'name': st.column_config.TextColumn("Select files to download or stream:"),
+            },
+            disabled=['name'],
+            hide_index=True,
+            use_container_width=True,
+            height=min(400, 35 * (len(names) + 1) + 3),
+            key=f"file_table_{st.session_state.get('_selector_rev', 0)}",
         )
-        
-        # Ensure session state is always in sync
-        if selected != st.session_state.get('selected_files', []):
-            st.session_state['selected_files'] = selected
+        selected = edited.loc[edited['select'], 'name'].tolist()
+        st.session_state['selected_files'] = selected
         
         # Show selection status
         if selected:
@@ -575,10 +760,12 @@ def main():
                 elif max_concurrency == 0:
                     st.error("Downloads are disabled! Set max parallel downloads to a positive number or -1 for unlimited.")
                 else:
-                    # Reset stop flag before starting
-                    st.session_state['stop_downloads'] = False
+                    # Fresh stop signal per batch; workers of a stopped batch keep the old, set one
+                    st.session_state['stop_event'] = threading.Event()
                     st.session_state['is_downloading'] = True
-                    files_to_download = [f for f in files if f['name'] in selected]
+                    # Name index built at fetch time: one dict lookup per selected file
+                    by_name = st.session_state.get('_files_by_name') or {f['name']: f for f in files}
+                    files_to_download = [by_name[name] for name in selected if name in by_name]
                     
                     # Show actual concurrency being used
                     if max_concurrency == -1:
@@ -588,18 +775,17 @@ def main():
                         st.info(f"📊 Using {max_concurrency} parallel downloads")
                     
                     # Start download thread
-                    download_thread = download_all_files(files_to_download, [f['name'] for f in files_to_download], download_dir, st.session_state['file_status'])
+                    download_thread = download_all_files(files_to_download, [f['name'] for f in files_to_download], download_dir, st.session_state['file_status'], st.session_state['stop_event'])
         
         # Show download progress if downloading
         if st.session_state.get('is_downloading', False):
-            st.markdown("""
-            <div class="progress-container">
-                <h3 style="margin-top: 0; color: #333;">📊 Download Progress</h3>
-            """, unsafe_allow_html=True)
-            
-            # Create placeholders for real-time updates
-            progress_placeholder = st.empty()
-            status_placeholder = st.empty()
+            # A real container instead of raw <div> markup: Streamlit cannot nest elements inside
+            # an HTML string, so the old open/close tags only cost two extra raw-HTML elements
+            with st.container(border=True):
+                st.markdown("#### 📊 Download Progress")
+                # Create placeholders for real-time updates; the loop below only updates these
+                progress_placeholder = st.empty()
+                status_placeholder = st.empty()
             
             # Control buttons
             col_refresh, col_stop, col_pause = st.columns([1, 1, 1])
@@ -610,31 +796,13 @@ def main():
             
             with col_stop:
                 if st.button("⏹️ Stop Downloads", help="Stop all downloads"):
-                    # Signal stop to shell processes
-                    st.session_state['stop_downloads'] = True
-                    # Primary stop mechanism: kill all wget/aria2c downloads immediately
-                    try:
-                        import subprocess as _sp, time as _t
-                        _sp.run(["pkill", "-TERM", "-f", "wget --progress=bar:force"], check=False)
-                        _t.sleep(0.2)
-                        _sp.run(["pkill", "-KILL", "-f", "wget --progress=bar:force"], check=False)
-                        _sp.run(["pkill", "-TERM", "aria2c"], check=False)
-                        _t.sleep(0.2)
-                        _sp.run(["pkill", "-KILL", "aria2c"], check=False)
-                    except Exception:
-                        pass
-                    # Cleanup any tracked processes
-                    try:
-                        st.session_state['active_download_processes'] = []
-                    except Exception:
-                        pass
+                    # Signal stop to the download workers and their shell processes
+                    ensure_stop_event().set()
                     # Mark in-progress items as stopped in status dict
                     try:
-                        file_status = st.session_state.get('file_status', {})
-                        for name, info in list(file_status.items()):
-                            if info.get('status') in ['downloading', 'paused']:
-                                file_status[name] = {'status': 'stopped', 'progress': info.get('progress', 0)}
-                        st.session_state['file_status'] = file_status
+                        for fs in st.session_state.get('file_status', {}).values():
+                            if fs.status in ('downloading', 'paused'):
+                                fs.status = 'stopped'
                     except Exception:
                         pass
                     st.session_state['is_downloading'] = False
@@ -648,42 +816,48 @@ def main():
                     st.info(f"Downloads {status}")
                     st.rerun()
             
-            # Real-time progress update loop (like original script)
-            import time
+            # Real-time progress update loop: wakes when a worker reports new state
             max_wait = 600  # 10 minutes max for polling
-            poll_interval = 0.5  # seconds
+            poll_interval = 0.5  # seconds, fallback when the status dict has no change event
             start_time = time.time()
+            last_snapshot = None
+            any_downloading = False
             
             while st.session_state.get('is_downloading', False) and (time.time() - start_time < max_wait):
                 file_status = st.session_state.get('file_status', {})
-                completed_files = sum(1 for name in selected if file_status.get(name, {}).get('status') in ['completed', 'already downloaded'])
-                failed_files = sum(1 for name in selected if str(file_status.get(name, {}).get('status', '')).startswith('error'))
-                total_selected = len(selected)
-                processed_files = completed_files + failed_files
-                progress = processed_files / total_selected if total_selected > 0 else 0
-                
-                # Update progress bar
-                progress_text = f"Progress: {processed_files}/{total_selected} processed ({completed_files} successful, {failed_files} failed)"
-                progress_placeholder.progress(progress, text=progress_text)
+                changed = getattr(file_status, 'changed', None)
+                if changed is not None:
+                    # Clear before reading so an update landing mid-render wakes the next wait
+                    changed.clear()
+                # Everything the rows display; when none of it moved, leave both placeholders alone
+                snapshot = tuple(
+                    (fs.status, fs.progress, fs.speed, fs.eta, fs.downloaded)
+                    for fs in (file_status.get(name, _NO_STATUS) for name in selected)
+                )
+                if snapshot == last_snapshot:
+                    _wait_for_progress(changed, any_downloading, poll_interval)
+                    continue
+                last_snapshot = snapshot
+                any_downloading = False
+                completed_files = 0
+                failed_files = 0
                 
-                # Update status lines
+                # One pass over the snapshot builds the status lines and both counters
                 status_lines = []
-                for name in selected:
-                    status_info = file_status.get(name, {})
-                    status = status_info.get('status', '-')
-                    progress_val = status_info.get('progress', 0)
-                    speed = status_info.get('speed', 0)
-                    eta = status_info.get('eta', 0)
-                    downloaded = status_info.get('downloaded', 0)
-                    
+                for name, row in zip(selected, snapshot):
+                    status = row[0]
+                    if status in _COMPLETED_SET:
+                        completed_files += 1
+                    elif status.startswith('error'):
+                        failed_files += 1
+
                     if status == 'completed':
                         status_lines.append(f"✅ `{name}`: Completed")
                     elif status == 'downloading':
-                        # Format speed and ETA
-                        speed_str = f"{speed/1024/1024:.1f} MB/s" if speed > 1024*1024 else f"{speed/1024:.1f} KB/s" if speed > 1024 else f"{speed:.1f} B/s"
-                        eta_str = f"{int(eta)}s" if eta < 60 else f"{int(eta/60)}m {int(eta%60)}s" if eta < 3600 else f"{int(eta/3600)}h {int((eta%3600)/60)}m"
-                        size_str = f"{downloaded/1024/1024:.1f} MB" if downloaded > 1024*1024 else f"{downloaded/1024:.1f} KB" if downloaded > 1024 else f"{downloaded} B"
-                        status_lines.append(f"⏳ `{name}`: Downloading ({progress_val:.1f}%) - {speed_str} - ETA: {eta_str} - {size_str}")
+                        any_downloading = True
+                        # Only active rows carry meaningful speed/ETA/size, so only they format them
+                        _, progress_val, speed, eta, downloaded = row
+                        status_lines.append(f"⏳ `{name}`: Downloading ({progress_val:.1f}%) - {_fmt_speed(speed)} - ETA: {_fmt_eta(eta)} - {_fmt_size(downloaded)}")
                     elif status == 'paused':
                         status_lines.append(f"⏸️ `{name}`: Paused")
                     elif status == 'stopped':
@@ -695,6 +869,14 @@ def main():
                     else:
                         status_lines.append(f"📄 `{name}`: {status}")
                 
+                total_selected = len(selected)
+                processed_files = completed_files + failed_files
+                progress = processed_files / total_selected if total_selected > 0 else 0
+                
+                # Update progress bar
+                progress_text = f"Progress: {processed_files}/{total_selected} processed ({completed_files} successful, {failed_files} failed)"
+                progress_placeholder.progress(progress, text=progress_text)
+                
                 # Update status display
                 status_placeholder.markdown("\n".join(status_lines))
                 
@@ -705,29 +887,26 @@ def main():
                     st.balloons()
                     break
                 
-                time.sleep(poll_interval)
+                _wait_for_progress(changed, any_downloading, poll_interval)
             
             # Final update after downloads
             file_status = st.session_state.get('file_status', {})
-            completed_files = sum(1 for name in selected if file_status.get(name, {}).get('status') in ['completed', 'already downloaded'])
-            failed_files = sum(1 for name in selected if str(file_status.get(name, {}).get('status', '')).startswith('error'))
-            total_selected = len(selected)
-            processed_files = completed_files + failed_files
-            progress = processed_files / total_selected if total_selected > 0 else 0
+            completed_files = 0
+            failed_files = 0
             
-            # Final progress update
-            progress_text = f"Progress: {processed_files}/{total_selected} processed ({completed_files} successful, {failed_files} failed)"
-            progress_placeholder.progress(progress, text=progress_text)
-            
-            # Final status update
+            # Final status update, counting in the same pass
             status_lines = []
             for name in selected:
-                status_info = file_status.get(name, {})
-                status = status_info.get('status', '-')
+                status_info = file_status.get(name, _NO_STATUS)
+                status = status_info.status
+                if status in _COMPLETED_SET:
+                    completed_files += 1
+                elif status.startswith('error'):
+                    failed_files += 1
                 if status == 'completed':
                     status_lines.append(f"✅ `{name}`: Completed")
                 elif status == 'downloading':
-                    prog = status_info.get('progress', 0)
+                    prog = status_info.progress
                     status_lines.append(f"⏳ `{name}`: Downloading ({prog:.1f}%)")
                 elif status == 'paused':
                     status_lines.append(f"⏸️ `{name}`: Paused")
@@ -740,10 +919,15 @@ def main():
                 else:
                     status_lines.append(f"📄 `{name}`: {status}")
             
-            status_placeholder.markdown("\n".join(status_lines))
+            total_selected = len(selected)
+            processed_files = completed_files + failed_files
+            progress = processed_files / total_selected if total_selected > 0 else 0
             
-            # Close progress container
-            st.markdown("</div>", unsafe_allow_html=True)
+            # Final progress update
+            progress_text = f"Progress: {processed_files}/{total_selected} processed ({completed_files} successful, {failed_files} failed)"
+            progress_placeholder.progress(progress, text=progress_text)
+            
+            status_placeholder.markdown("\n".join(status_lines))
         
         # Stream button
         with col_stream:
@@ -753,7 +937,7 @@ def main():
                 else:
                     with st.spinner("Preparing streaming URLs..."):
                         try:
-                            urls, names = asyncio.run(prepare_streaming_urls(files, selected, download_dir))
+                            urls, names = run_on_background_loop(prepare_streaming_urls(files, selected, download_dir, ensure_terminal()))
                             if urls:
                                 stream_all_in_vlc(urls, names)
                                 
@@ -792,18 +976,8 @@ def main():
             if len(video_files) > 5:
                 st.write(f"... and {len(video_files) - 5} more")
             
-            # Show available hardware acceleration
-            acceleration = detect_hardware_acceleration()
-            hw_info = []
-            if acceleration['nvenc']:
-                hw_info.append("🚀 NVIDIA NVENC")
-            if acceleration['qsv']:
-                hw_info.append("⚡ Intel QSV")
-            if acceleration['vaapi']:
-                hw_info.append("🔧 VA-API")
-            if acceleration['videotoolbox'] and PLATFORM_CONFIG['is_macos']:
-                hw_info.append("🍎 VideoToolbox + Metal GPU (macOS)")
-            hw_info.append("🖥️ CPU")
+            # Show available hardware acceleration (probe is cached; menu is memoized per result)
+            preset_options, hw_info = _encoder_menu(_usable_backends(_cached_hwaccel()))
             
             st.info(f"Available encoders: {', '.join(hw_info)}")
             
@@ -811,17 +985,6 @@ def main():
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                preset_options = ["auto", "copy"]
-                if acceleration['nvenc']:
-                    preset_options.extend(["h264_nvenc", "h265_nvenc"])
-                if acceleration['qsv']:
-                    preset_options.extend(["h264_qsv", "h265_qsv"])
-                if acceleration['vaapi']:
-                    preset_options.extend(["h264_vaapi", "h265_vaapi"])
-                if acceleration['videotoolbox'] and PLATFORM_CONFIG['is_macos']:
-                    preset_options.extend(["h264_videotoolbox", "h265_videotoolbox"])
-                preset_options.extend(["h264_cpu", "h265_cpu"])
-                
                 preset = st.selectbox(
                     "Encoding Preset",
                     preset_options,
@@ -0,0 +1,26 @@
+"""Optional Numba kernels for the intro/outro matcher; import only where numba is available."""
+
+import numba
+import numpy as np
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def sliding_correlation(M, tpl, tpl_norm, tpl_frames, step, f0, n_windows):
+    """Pearson correlation of a mean-centred tpl against M[:, f:f+tpl_frames] for f = f0, f0+step, ..."""
+    sims = np.empty(n_windows, dtype=np.float32)
+    n = M.shape[0] * tpl_frames
+    for w in numba.prange(n_windows):
+        f = f0 + w * step
+        dot = 0.0
+        total = 0.0
+        norm_sq = 0.0
+        for r in range(M.shape[0]):
+            for k in range(tpl_frames):
+                v = M[r, f + k]
+                # tpl sums to zero, so this equals the dot with the centred window
+                dot += v * tpl[r, k]
+                total += v
+                norm_sq += v * v
+        centred_sq = max(norm_sq - total * total / n, 0.0)
+        sims[w] = dot / (np.sqrt(centred_sq) * tpl_norm + 1e-12)
+    return sims
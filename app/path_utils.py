@@ -1,9 +1,12 @@
 """Path and URL utilities for download manager."""
 
+import functools
 import os
 import re
 import shutil
+import sys
 import urllib.parse
+from pathlib import Path
 
 import streamlit as st
 
@@ -17,31 +20,59 @@ def get_base_download_dir():
 
 def ensure_download_dir(folder_name):
     full_path = os.path.join(get_base_download_dir(), folder_name)
-    if not os.path.exists(full_path):
-        os.makedirs(full_path)
+    # Remember directories already created this session so reruns skip the stat
+    ensured = st.session_state.setdefault("_dirs_ensured", set())
+    if full_path not in ensured:
+        os.makedirs(full_path, exist_ok=True)
+        ensured.add(full_path)
     return full_path
 
 
 def remove_download_dir(folder_name):
     full_path = os.path.join(get_base_download_dir(), folder_name)
+    st.session_state.get("_dirs_ensured", set()).discard(full_path)
     if os.path.exists(full_path):
         shutil.rmtree(full_path)
 
 
+@functools.lru_cache(maxsize=256)
 def is_youtube_url(url):
     parsed = urllib.parse.urlparse(url)
     return any(domain in parsed.netloc for domain in YOUTUBE_DOMAINS)
 
 
+# Newlines and characters that are unsafe in filenames all become "_" in one translate pass
+_UNSAFE_TABLE = str.maketrans(dict.fromkeys('\n\r\\/:*?"<>|', "_"))
+_MULTI_UNDERSCORE = re.compile(r"__+")
+
+
 def normalize_filename(filename):
     """Normalize filename for safe filesystem usage."""
-    filename = filename.replace("\n", "_").replace("\r", "_")
-    filename = re.sub(r'[\\/:*?"<>|]', "_", filename)
-    filename = re.sub(r"_+", "_", filename)
+    filename = filename.translate(_UNSAFE_TABLE)
+    filename = _MULTI_UNDERSCORE.sub("_", filename)
     filename = filename.strip(" _")
     return filename[:200]
 
 
+def file_uri(abs_path):
+    """file:// URI for an absolute path; on POSIX the same result as Path.as_uri() without the Path allocation."""
+    if sys.platform == "win32":
+        return Path(abs_path).as_uri()
+    return "file://" + urllib.parse.quote(abs_path)
+
+
+def local_playlist(paths, root_dir):
+    """(display names relative to root_dir, file:// URIs) for paths, built in a single pass."""
+    cwd = os.getcwd()
+    names, urls = [], []
+    for p in paths:
+        abs_path = p if os.path.isabs(p) else os.path.join(cwd, p)
+        names.append(os.path.relpath(abs_path, root_dir))
+        urls.append(file_uri(abs_path))
+    return names, urls
+
+
+@functools.lru_cache(maxsize=256)
 def get_folder_name_from_url(url, playlist_title=None):
     """Get folder name from URL, using playlist title for YouTube playlists."""
     if is_youtube_url(url) and playlist_title:
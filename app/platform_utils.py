@@ -1,3 +1,4 @@
+import functools
 import os
 import platform
 import subprocess
@@ -6,6 +7,16 @@ from typing import Any, Dict
 import distro  # type: ignore
 
 
+@functools.lru_cache(maxsize=1)
+def homebrew_installed() -> bool:
+    """Whether a working brew is on PATH; probed on first use instead of at import."""
+    try:
+        subprocess.run(["brew", "--version"], capture_output=True, check=True)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+
 def detect_platform() -> Dict[str, Any]:
     """Detect the current platform and return platform-specific configurations."""
     system = platform.system().lower()
@@ -31,16 +42,9 @@ def detect_platform() -> Dict[str, Any]:
         config["system_packages"] = ["ffmpeg", "wget", "curl", "aria2", "node"]
         config["hardware_acceleration"] = ["videotoolbox", "metal"]
 
-        try:
-            subprocess.run(["brew", "--version"], capture_output=True, check=True)
-            config["homebrew_installed"] = True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            config["homebrew_installed"] = False
-
     elif config["is_linux"]:
         try:
-            distro_info = distro.linux_distribution(full_distribution_name=False)
-            distro_name = distro_info[0].lower()
+            distro_name = distro.id().lower()
 
             if "ubuntu" in distro_name or "debian" in distro_name:
                 config["package_manager"] = "apt"
@@ -1,10 +1,12 @@
 """Install prerequisites and detect hardware acceleration."""
 
-from typing import Dict
+import functools
+import subprocess
+from typing import Dict, FrozenSet
 
 import streamlit as st
 
-from .platform_utils import PLATFORM_CONFIG
+from .platform_utils import PLATFORM_CONFIG, homebrew_installed
 from .shell_utils import (
     TerminalOutput,
     check_command_exists,
@@ -25,22 +27,28 @@ def install_prerequisites():
     )
     st.info(f"Installing prerequisites for {PLATFORM_CONFIG['os']}...")
 
-    if PLATFORM_CONFIG["is_macos"]:
-        return install_prerequisites_macos(terminal)
-    elif PLATFORM_CONFIG["is_linux"]:
-        return install_prerequisites_linux(terminal)
-    elif PLATFORM_CONFIG["is_windows"]:
-        return install_prerequisites_windows(terminal)
-    else:
-        st.error(f"❌ Unsupported operating system: {PLATFORM_CONFIG['os']}")
-        terminal.add_line(f"Unsupported OS: {PLATFORM_CONFIG['os']}", "error")
-        return False
+    # Installs change what is on PATH, so drop cached command lookups before and after
+    check_command_exists.cache_clear()
+    try:
+        if PLATFORM_CONFIG["is_macos"]:
+            return install_prerequisites_macos(terminal)
+        elif PLATFORM_CONFIG["is_linux"]:
+            return install_prerequisites_linux(terminal)
+        elif PLATFORM_CONFIG["is_windows"]:
+            return install_prerequisites_windows(terminal)
+        else:
+            st.error(f"❌ Unsupported operating system: {PLATFORM_CONFIG['os']}")
+            terminal.add_line(f"Unsupported OS: {PLATFORM_CONFIG['os']}", "error")
+            return False
+    finally:
+        check_command_exists.cache_clear()
+        available_encoders.cache_clear()
 
 
 def install_prerequisites_macos(terminal):
     """Install prerequisites on macOS using Homebrew."""
     st.info("🍎 Installing prerequisites on macOS...")
-    if not PLATFORM_CONFIG.get("homebrew_installed", False):
+    if not homebrew_installed():
         st.warning("⚠️ Homebrew not found. Installing Homebrew first...")
         terminal.add_line("Installing Homebrew...", "info")
         install_cmd = '/bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"'
@@ -49,6 +57,7 @@ def install_prerequisites_macos(terminal):
             st.error("❌ Failed to install Homebrew. Please install it manually from https://brew.sh")
             terminal.add_line("Failed to install Homebrew", "error")
             return False
+        homebrew_installed.cache_clear()
         st.success("✅ Homebrew installed!")
         terminal.add_line("Homebrew installed successfully", "info")
 
@@ -412,6 +421,7 @@ def install_torrent_options(terminal):
         result = run_shell_command_with_output("sudo npm install -g webtorrent-cli", timeout=300)
     else:
         result = run_shell_command_with_output("npm install -g webtorrent-cli", timeout=300)
+    check_command_exists.cache_clear()
     if not result.get("success"):
         st.warning("Failed to install webtorrent-cli. Try: npm install -g webtorrent-cli")
         terminal.add_line("Failed to install webtorrent-cli", "error")
@@ -421,6 +431,28 @@ def install_torrent_options(terminal):
     return True
 
 
+# One-second synthetic clip used to check that a hardware encoder actually opens a session
+_TEST_ENCODE = ["ffmpeg", "-f", "lavfi", "-i", "testsrc=duration=1:size=320x240:rate=1"]
+
+
+@functools.lru_cache(maxsize=1)
+def available_encoders() -> FrozenSet[str]:
+    """Names of the encoders compiled into the local ffmpeg (empty if ffmpeg cannot be run)."""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=30
+        )
+    except Exception:
+        return frozenset()
+    names = set()
+    listing = result.stdout.split("------", 1)[-1]
+    for line in listing.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            names.add(parts[1])
+    return frozenset(names)
+
+
 def detect_hardware_acceleration() -> Dict[str, bool]:
     """Detect available hardware acceleration using shell commands."""
     acceleration = {
@@ -430,15 +462,14 @@ def detect_hardware_acceleration() -> Dict[str, bool]:
         "videotoolbox": False,
         "cpu": True,
     }
-    hwaccel_result = run_shell_command("ffmpeg -hide_banner -hwaccels 2>/dev/null")
+    hwaccel_result = run_shell_command(["ffmpeg", "-hide_banner", "-hwaccels"])
     if hwaccel_result["success"]:
         hwaccels = hwaccel_result["stdout"]
         if "videotoolbox" in hwaccels and PLATFORM_CONFIG["is_macos"]:
             acceleration["videotoolbox"] = True
 
-    result = run_shell_command("ffmpeg -hide_banner -encoders 2>/dev/null")
-    if result["success"]:
-        encoders = result["stdout"]
+    encoders = available_encoders()
+    if encoders:
         acceleration["nvenc"] = "h264_nvenc" in encoders or "hevc_nvenc" in encoders
         acceleration["qsv"] = "h264_qsv" in encoders or "hevc_qsv" in encoders
         acceleration["vaapi"] = "h264_vaapi" in encoders or "hevc_vaapi" in encoders
@@ -448,12 +479,12 @@ def detect_hardware_acceleration() -> Dict[str, bool]:
             )
 
     if acceleration["nvenc"]:
-        test_result = run_shell_command("ffmpeg -f lavfi -i testsrc=duration=1:size=320x240:rate=1 -c:v h264_nvenc -f null - 2>&1")
+        test_result = run_shell_command(_TEST_ENCODE + ["-c:v", "h264_nvenc", "-f", "null", "-"])
         if not test_result["success"] or "No capable devices found" in test_result["stderr"]:
             acceleration["nvenc"] = False
 
     if acceleration["videotoolbox"] and PLATFORM_CONFIG["is_macos"]:
-        test_result = run_shell_command("ffmpeg -f lavfi -i testsrc=duration=1:size=320x240:rate=1 -c:v h264_videotoolbox -q:v 20 -f null - 2>&1")
+        test_result = run_shell_command(_TEST_ENCODE + ["-c:v", "h264_videotoolbox", "-q:v", "20", "-f", "null", "-"])
         if not test_result["success"] or "No capable devices found" in test_result["stderr"]:
             acceleration["videotoolbox"] = False
 
@@ -1,20 +1,34 @@
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import html
 import os
+import shlex
+import shutil
+import signal
 import subprocess
 import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple, Union
 
 import streamlit as st
 
 
 class TerminalOutput:
     def __init__(self) -> None:
-        self.output_queue: "queue.Queue[str]" = __import__("queue").Queue()
-        self.max_lines = 100
+        # Rolling tail: old lines fall off so render cost stays flat on long installs
+        self.lines: "collections.deque[str]" = collections.deque(maxlen=500)
+        self.max_lines = 500
         self.command_count = 0
+        # Bumped on every append/clear so renderers can reuse their last HTML
+        self.revision = 0
 
     def add_line(self, text: str, cmd_type: str = "info") -> None:
         timestamp = datetime.now().strftime("%H:%M:%S")
+        # Log text is arbitrary (filenames, tool output); escape it so only our spans are markup
+        text = html.escape(text, quote=False)
         if cmd_type == "command":
             self.command_count += 1
             formatted_text = (
@@ -37,23 +51,20 @@ class TerminalOutput:
         else:
             formatted_text = f"<span style='color: #ffffff;'>[{timestamp}] {text}</span>"
 
-        self.output_queue.put(formatted_text)
+        self.lines.append(formatted_text)
+        self.revision += 1
+
+    def get_tail(self, n: int = 500) -> List[str]:
+        """Return the last n formatted lines without consuming them."""
+        lines = list(self.lines)
+        return lines[-n:] if n < len(lines) else lines
 
     def get_output(self) -> List[str]:
-        lines: List[str] = []
-        while not self.output_queue.empty() and len(lines) < self.max_lines:
-            try:
-                lines.append(self.output_queue.get_nowait())
-            except __import__("queue").Empty:
-                break
-        return lines[-self.max_lines :]
+        return self.get_tail(self.max_lines)
 
     def clear(self) -> None:
-        while not self.output_queue.empty():
-            try:
-                self.output_queue.get_nowait()
-            except __import__("queue").Empty:
-                break
+        self.lines.clear()
+        self.revision += 1
 
 
 def ensure_terminal() -> TerminalOutput:
@@ -62,28 +73,47 @@ def ensure_terminal() -> TerminalOutput:
     return st.session_state.terminal_output
 
 
+def ensure_stop_event() -> threading.Event:
+    """This session's Stop signal. Worker threads have no session, so they are handed it."""
+    if "stop_event" not in st.session_state:
+        st.session_state.stop_event = threading.Event()
+    return st.session_state.stop_event
+
+
+def _resolve_argv(cmd: List[str]) -> List[str]:
+    """argv with an absolute executable path, as posix_spawn needs; unchanged if not on PATH."""
+    exe = shutil.which(cmd[0])
+    return [exe, *cmd[1:]] if exe else cmd
+
+
 def run_shell_command_with_output(
-    cmd: str,
+    cmd: Union[str, List[str]],
     cwd: Optional[str] = None,
     timeout: int = 300,
     show_in_terminal: bool = True,
+    input_text: Optional[str] = None,
+    cpu_affinity: Optional[FrozenSet[int]] = None,
+    terminal: Optional[TerminalOutput] = None,
+    stop_event: Optional[threading.Event] = None,
 ) -> Dict[str, Any]:
-    if "terminal_output" not in st.session_state:
-        st.session_state.terminal_output = TerminalOutput()
-    if "active_download_processes" not in st.session_state:
-        st.session_state.active_download_processes = []
-    if "stop_downloads" not in st.session_state:
-        st.session_state["stop_downloads"] = False
+    # Worker threads have no session and pass both; script-thread callers use the session's
+    if terminal is None:
+        terminal = ensure_terminal()
+    if stop_event is None:
+        stop_event = ensure_stop_event()
 
-    terminal = st.session_state.terminal_output
     if show_in_terminal:
-        terminal.add_line(f"$ {cmd}", "command")
+        terminal.add_line(f"$ {cmd if isinstance(cmd, str) else shlex.join(cmd)}", "command")
 
     try:
+        # argv lists are exec'd directly; only plain strings go through /bin/sh.
+        # Every command gets its own session so Stop can killpg the whole tree
+        # (yt-dlp's aria2c/ffmpeg children included)
         process = subprocess.Popen(
             cmd,
-            shell=True,
+            shell=isinstance(cmd, str),
             cwd=cwd,
+            stdin=subprocess.PIPE if input_text is not None else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
@@ -91,20 +121,33 @@ def run_shell_command_with_output(
             universal_newlines=True,
             start_new_session=True,
         )
-        try:
-            st.session_state.active_download_processes.append(process)
-        except Exception:
-            pass
+        if cpu_affinity:
+            # Pin right after spawn, before the child starts its worker threads
+            try:
+                os.sched_setaffinity(process.pid, cpu_affinity)
+            except (AttributeError, OSError):
+                pass
+        if input_text is not None:
+            # Feed stdin from a helper thread so a chatty child cannot deadlock us
+            def _feed_stdin() -> None:
+                try:
+                    # Encode once and hand the whole payload to the pipe's binary layer,
+                    # bypassing the line-buffered text wrapper's per-line flushing
+                    payload = input_text.encode(process.stdin.encoding or "utf-8")
+                    process.stdin.buffer.write(payload)
+                    process.stdin.close()
+                except Exception:
+                    pass
+
+            threading.Thread(target=_feed_stdin, daemon=True).start()
 
         stdout_lines: List[str] = []
 
         while True:
-            if st.session_state.get("stop_downloads"):
+            if stop_event.is_set():
                 try:
-                    import signal as _signal, os as _os
-
                     try:
-                        _os.killpg(process.pid, _signal.SIGTERM)
+                        os.killpg(process.pid, signal.SIGTERM)
                     except Exception:
                         process.terminate()
                 except Exception:
@@ -127,13 +170,6 @@ def run_shell_command_with_output(
             except Exception:
                 pass
 
-        try:
-            st.session_state.active_download_processes = [
-                p for p in st.session_state.active_download_processes if p is not process
-            ]
-        except Exception:
-            pass
-
         return {
             "success": process.returncode == 0,
             "stdout": "\n".join(stdout_lines),
@@ -157,21 +193,24 @@ def run_shell_command_with_output(
 
 
 def run_shell_command(
-    cmd: str,
+    cmd: Union[str, List[str]],
     cwd: Optional[str] = None,
     timeout: int = 300,
     interactive: bool = False,
 ) -> Dict[str, Any]:
     if interactive:
         return run_shell_command_with_output(cmd, cwd, timeout, show_in_terminal=True)
+    # Captured one-shot probes (ffprobe, pgrep, --version) are the posix_spawn-eligible case
+    spawnable = not isinstance(cmd, str) and cwd is None
     try:
         result = subprocess.run(
-            cmd,
-            shell=True,
+            _resolve_argv(cmd) if spawnable else cmd,
+            shell=isinstance(cmd, str),
             cwd=cwd,
             capture_output=True,
             text=True,
             timeout=timeout,
+            close_fds=not spawnable,
         )
         return {
             "success": result.returncode == 0,
@@ -190,8 +229,129 @@ def run_shell_command(
         return {"success": False, "stdout": "", "stderr": str(e), "returncode": -1}
 
 
+@functools.lru_cache(maxsize=32)
 def check_command_exists(command: str) -> bool:
-    result = run_shell_command(f"which {command}")
-    return result["success"]
+    # Same PATH lookup as `which`, without forking a process for it
+    return shutil.which(command) is not None
+
+
+def which_many(commands: Tuple[str, ...]) -> Dict[str, bool]:
+    """Availability of several commands from a single listing of each PATH directory."""
+    path_dirs = [d for d in os.environ.get("PATH", "").split(os.pathsep) if d]
+    present: Set[str] = set()
+    for d in path_dirs:
+        try:
+            with os.scandir(d) as it:
+                present.update(e.name for e in it)
+        except OSError:
+            pass
+    # Names not seen in any listing still get the exact shutil.which check
+    return {cmd: cmd in present or check_command_exists(cmd) for cmd in commands}
 
 
+def find_pids(names: Tuple[str, ...] = (), cmdline_patterns: Tuple[str, ...] = ()) -> List[int]:
+    """PIDs whose process name matches any of names, or whose full command line matches
+    any of cmdline_patterns; one pgrep call per match mode instead of one per name."""
+    pids: Set[int] = set()
+    for flags, patterns in (([], names), (["-f"], cmdline_patterns)):
+        if patterns:
+            result = run_shell_command(["pgrep", *flags, "|".join(patterns)], timeout=5)
+            pids.update(int(p) for p in result["stdout"].split() if p.isdigit())
+    pids.discard(os.getpid())
+    return sorted(pids)
+
+
+def signal_processes(sig: int, names: Tuple[str, ...] = (), cmdline_patterns: Tuple[str, ...] = ()) -> List[int]:
+    """Send sig to every matching process; returns the PIDs it reached."""
+    sent = []
+    for pid in find_pids(names, cmdline_patterns):
+        try:
+            os.kill(pid, sig)
+            sent.append(pid)
+        except OSError:
+            pass
+    return sent
+
+
+def terminate_processes(names: Tuple[str, ...] = (), cmdline_patterns: Tuple[str, ...] = (), grace: float = 0.2) -> None:
+    """SIGTERM matching processes, then SIGKILL whatever is still alive after grace seconds."""
+    pids = signal_processes(signal.SIGTERM, names, cmdline_patterns)
+    deadline = time.monotonic() + grace
+    while pids and time.monotonic() < deadline:
+        time.sleep(0.02)
+        pids = [pid for pid in pids if _pid_alive(pid)]
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+_bg_loop: Optional[asyncio.AbstractEventLoop] = None
+_bg_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop that supervises long-running child processes."""
+    global _bg_loop
+    with _bg_loop_lock:
+        if _bg_loop is None:
+            _bg_loop = asyncio.new_event_loop()
+            threading.Thread(target=_bg_loop.run_forever, daemon=True, name="bg-process-loop").start()
+        return _bg_loop
+
+
+def run_in_background(coro: Any) -> "concurrent.futures.Future[Any]":
+    """Schedule a coroutine on the background loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+
+
+def run_on_background_loop(coro: Any, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine to completion on the shared loop and return its result.
+
+    Unlike asyncio.run this keeps one loop (and the aiohttp pool bound to it) alive across
+    calls. The loop thread is shared by every session and carries no script context, so
+    the coroutine must not touch st.*; pass it session objects such as the terminal instead.
+    """
+    return run_in_background(coro).result(timeout)
+
+
+async def stream_command_to_terminal(
+    argv: List[str],
+    terminal: TerminalOutput,
+    timeout: int = 86400,
+) -> int:
+    """Run argv, relaying its output lines to the terminal; return the exit code (-1 on error)."""
+    terminal.add_line(f"$ {shlex.join(argv)}", "command")
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+    except Exception as e:
+        terminal.add_line(f"Error: {str(e)}", "error")
+        return -1
+
+    async def relay() -> int:
+        async for raw in process.stdout:
+            line = raw.decode(errors="replace").strip()
+            if line:
+                terminal.add_line(line, "output")
+        return await process.wait()
+
+    try:
+        return await asyncio.wait_for(relay(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        terminal.add_line("Command timed out", "error")
+        return -1
@@ -1,15 +1,25 @@
+import asyncio
+import base64
 import os
 import threading
-from pathlib import Path
-from typing import List, Tuple
+from typing import Iterator, List, Set, Tuple
 
 import streamlit as st
 
-from .shell_utils import TerminalOutput, check_command_exists, ensure_terminal, run_shell_command_with_output
+from .aria2_rpc import add_uri, aria2_call, aria2_multicall, ensure_aria2_daemon, tell_status_many
+from .shell_utils import TerminalOutput, check_command_exists, ensure_terminal, run_in_background, stream_command_to_terminal
 
 TORRENT_EXTENSIONS = (".torrent",)
 MAGNET_PREFIX = "magnet:?"
 
+# Command-line marker of the one-shot aria2c used when the RPC daemon is unavailable
+ARIA2_CLI_PATTERN = "aria2c --seed-time=0"
+_TORRENT_STATUS_KEYS = ["gid", "status", "followedBy", "errorMessage", "completedLength", "totalLength"]
+
+# GIDs of torrents queued on the shared aria2 daemon, so pause/stop leave HTTP downloads alone
+_torrent_gids: Set[str] = set()
+_torrent_gids_lock = threading.Lock()
+
 
 def is_torrent_link(url: str) -> bool:
     if not url:
@@ -35,24 +45,89 @@ def start_torrent_download_with_aria2(torrent_url: str, download_dir: str) -> bo
         terminal.add_line("The provided link does not look like a torrent or magnet link.", "error")
         return False
 
+    if ensure_aria2_daemon():
+        # The daemon keeps its DHT table and tracker connections warm across torrents
+        options = {"dir": download_dir, "seed-time": "0"}
+        try:
+            if os.path.isfile(url):
+                with open(url, "rb") as f:
+                    gid = aria2_call("aria2.addTorrent", base64.b64encode(f.read()).decode("ascii"), [], options)
+            else:
+                gid = add_uri(url, options)
+        except Exception as e:
+            terminal.add_line(f"aria2 RPC rejected the torrent: {e}", "error")
+            return False
+        with _torrent_gids_lock:
+            _torrent_gids.add(gid)
+        terminal.add_line(f"Queued torrent on aria2 daemon into {download_dir} (gid {gid})", "info")
+        run_in_background(_watch_torrent(gid, terminal))
+        return True
+
     parent_pid = os.getpid()
-    cmd = f"aria2c --seed-time=0 --stop-with-process={parent_pid} --dir='{download_dir}' '{url}'"
+    cmd = ["aria2c", "--seed-time=0", f"--stop-with-process={parent_pid}", f"--dir={download_dir}", url]
 
-    def _run() -> None:
+    async def _run() -> None:
         terminal.add_line(f"Starting aria2c torrent download into {download_dir}", "info")
-        result = run_shell_command_with_output(cmd, timeout=86400, show_in_terminal=True)
-        if result["success"]:
+        returncode = await stream_command_to_terminal(cmd, terminal, timeout=86400)
+        if returncode == 0:
             terminal.add_line("✅ Torrent download completed.", "success")
         else:
-            terminal.add_line(
-                f"❌ Torrent download exited with code {result.get('returncode')}", "error"
-            )
+            terminal.add_line(f"❌ Torrent download exited with code {returncode}", "error")
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    run_in_background(_run())
     return True
 
 
+async def _watch_torrent(gid: str, terminal: TerminalOutput, interval: float = 2.0) -> None:
+    """Report a daemon torrent's outcome, following magnet metadata GIDs to the real download."""
+    loop = asyncio.get_running_loop()
+    pending = [gid]
+    while pending:
+        await asyncio.sleep(interval)
+        try:
+            statuses = await loop.run_in_executor(None, tell_status_many, pending, _TORRENT_STATUS_KEYS)
+        except Exception as e:
+            terminal.add_line(f"Lost contact with aria2 daemon: {e}", "warning")
+            return
+        still_running = []
+        for current, status in zip(pending, statuses):
+            state = status.get("status")
+            if state == "complete":
+                followers = status.get("followedBy") or []
+                if followers:
+                    # A magnet first downloads metadata, then aria2 starts the payload under new GIDs
+                    with _torrent_gids_lock:
+                        _torrent_gids.update(followers)
+                    still_running.extend(followers)
+                else:
+                    terminal.add_line("✅ Torrent download completed.", "success")
+            elif state == "error":
+                terminal.add_line(f"❌ Torrent download failed: {status.get('errorMessage', '')}", "error")
+            elif state == "removed":
+                terminal.add_line("Torrent download stopped.", "warning")
+            else:
+                still_running.append(current)
+            if state in ("complete", "error", "removed"):
+                with _torrent_gids_lock:
+                    _torrent_gids.discard(current)
+        pending = still_running
+
+
+def control_torrents(action: str) -> int:
+    """Apply 'pause', 'resume' or 'remove' to every torrent on the aria2 daemon; returns how many were addressed."""
+    method = {"pause": "aria2.forcePause", "resume": "aria2.unpause", "remove": "aria2.forceRemove"}[action]
+    with _torrent_gids_lock:
+        gids = list(_torrent_gids)
+    if not gids:
+        return 0
+    try:
+        # Faults for GIDs that already finished come back per call and are ignored
+        aria2_multicall([(method, gid) for gid in gids])
+    except Exception:
+        return 0
+    return len(gids)
+
+
 def stream_torrent_via_webtorrent(torrent_ref: str) -> bool:
     terminal = ensure_terminal()
 
@@ -71,32 +146,63 @@ def stream_torrent_via_webtorrent(torrent_ref: str) -> bool:
         terminal.add_line("No torrent reference provided for streaming.", "error")
         return False
 
-    cmd = f'webtorrent "{ref}" --vlc'
+    cmd = ["webtorrent", ref, "--vlc"]
 
-    def _run() -> None:
+    async def _run() -> None:
         terminal.add_line("Starting webtorrent streaming to VLC...", "info")
-        result = run_shell_command_with_output(cmd, timeout=86400, show_in_terminal=True)
-        if result.get("returncode") not in (0, None):
-            terminal.add_line(f"webtorrent exited with code {result.get('returncode')}", "warning")
+        returncode = await stream_command_to_terminal(cmd, terminal, timeout=86400)
+        if returncode != 0:
+            terminal.add_line(f"webtorrent exited with code {returncode}", "warning")
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    run_in_background(_run())
     return True
 
 
-def collect_torrent_video_files(root_dir: str, video_extensions: Tuple[str, ...]) -> List[str]:
-    video_paths: List[str] = []
-    if not os.path.isdir(root_dir):
-        return video_paths
+def save_uploaded_torrent(uploaded, dest_dir: str) -> str:
+    """Write an uploaded .torrent into dest_dir and return its path; an identical copy already there is reused."""
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, os.path.basename(uploaded.name))
+    # getbuffer() is a zero-copy view of the upload, so neither the compare nor the write copies it
+    data = uploaded.getbuffer()
     try:
-        for root, _dirs, files_in_dir in os.walk(root_dir):
-            for entry in files_in_dir:
-                if entry.lower().endswith(video_extensions):
-                    full = os.path.join(root, entry)
-                    if os.path.isfile(full):
-                        video_paths.append(full)
-    except Exception:
-        return []
-    return video_paths
+        if os.path.getsize(path) == data.nbytes:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return path
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _iter_videos(root_dir: str, video_extensions: Tuple[str, ...]) -> Iterator[str]:
+    # scandir yields name and type from the directory read itself, so no stat per entry
+    ext_set = frozenset(e.lower() for e in video_extensions)
+    stack = [root_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        # Lowercase only the extension, and skip names without one
+                        name = entry.name
+                        dot = name.rfind(".")
+                        if dot != -1 and name[dot:].lower() in ext_set:
+                            yield entry.path
+        except OSError:
+            continue
+
+
+# The 5s TTL is the only freshness check: torrents write into subdirectories, which
+# never bump the root's mtime, so reruns see new files within 5s at most
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_torrent_videos(root_dir: str, video_extensions: Tuple[str, ...]) -> List[str]:
+    return sorted(_iter_videos(root_dir, video_extensions))
 
 
+def collect_torrent_video_files(root_dir: str, video_extensions: Tuple[str, ...]) -> List[str]:
+    return _cached_torrent_videos(root_dir, tuple(video_extensions))
@@ -1,15 +1,26 @@
 import os
-from pathlib import Path
+import shutil
+import signal
 
 import streamlit as st
 
+from .config import VIDEO_EXTENSIONS
+from .download import StatusBoard, stream_all_in_vlc
+from .path_utils import local_playlist
 from .platform_utils import PLATFORM_CONFIG
-from .shell_utils import ensure_terminal
-from .torrent import collect_torrent_video_files, is_torrent_link, start_torrent_download_with_aria2, stream_torrent_via_webtorrent
+from .shell_utils import ensure_stop_event, ensure_terminal, signal_processes, terminate_processes
+from .torrent import (
+    ARIA2_CLI_PATTERN,
+    collect_torrent_video_files,
+    control_torrents,
+    is_torrent_link,
+    save_uploaded_torrent,
+    start_torrent_download_with_aria2,
+    stream_torrent_via_webtorrent,
+)
 
 
 BASE_DOWNLOAD_DIR = os.path.expanduser("~/Downloads/StreamlitDownloads")
-VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm")
 
 
 def get_base_download_dir() -> str:
@@ -35,31 +46,9 @@ def render_header() -> None:
     )
 
 
-def render_terminal() -> None:
-    terminal = ensure_terminal()
-
-    st.markdown("### 📺 Terminal Output")
-    col_refresh, col_clear, col_auto = st.columns([1, 1, 2])
-
-    with col_refresh:
-        if st.button("🔄 Refresh Terminal", help="Refresh terminal output"):
-            st.rerun()
-
-    with col_clear:
-        if st.button("🗑️ Clear Terminal", help="Clear terminal output"):
-            terminal.clear()
-            st.rerun()
-
-    with col_auto:
-        auto_refresh = st.checkbox(
-            "🔄 Auto-refresh (2s)",
-            value=True,
-            help="Automatically refresh terminal every 2 seconds",
-        )
-
-    terminal_output = terminal.get_output()
-    if terminal_output:
-        terminal_html = f"""
+def _terminal_html(lines: list) -> str:
+    """Wrap formatted terminal lines in the dark console panel."""
+    return f"""
         <div style="
             background-color: #1e1e1e;
             color: #ffffff;
@@ -73,24 +62,52 @@ def render_terminal() -> None:
             border: 1px solid #333;
             white-space: pre-wrap;
         ">
-        {''.join(terminal_output)}
+        {''.join(lines)}
         </div>
         """
+
+
+def render_terminal_output() -> None:
+    terminal = ensure_terminal()
+    # Rebuild the HTML only when new lines arrived since the last paint
+    cached = st.session_state.get('_term_html')
+    if cached is not None and cached[0] is terminal and cached[1] == terminal.revision:
+        terminal_html = cached[2]
+    else:
+        terminal_output = terminal.get_tail(500)
+        terminal_html = _terminal_html(terminal_output) if terminal_output else None
+        st.session_state['_term_html'] = (terminal, terminal.revision, terminal_html)
+    if terminal_html:
         st.markdown(terminal_html, unsafe_allow_html=True)
     else:
         st.info("No terminal output yet. Run commands to see output here.")
 
-    if auto_refresh and terminal_output:
-        import time
 
-        if "last_terminal_refresh" not in st.session_state:
-            st.session_state["last_terminal_refresh"] = time.time()
+def render_terminal() -> None:
+    terminal = ensure_terminal()
 
-        current_time = time.time()
-        if current_time - st.session_state["last_terminal_refresh"] > 2:
-            st.session_state["last_terminal_refresh"] = current_time
+    st.markdown("### 📺 Terminal Output")
+    col_refresh, col_clear, col_auto = st.columns([1, 1, 2])
+
+    with col_refresh:
+        if st.button("🔄 Refresh Terminal", help="Refresh terminal output"):
             st.rerun()
 
+    with col_clear:
+        if st.button("🗑️ Clear Terminal", help="Clear terminal output"):
+            terminal.clear()
+            st.rerun()
+
+    with col_auto:
+        auto_refresh = st.checkbox(
+            "🔄 Auto-refresh (2s)",
+            value=True,
+            help="Automatically refresh terminal every 2 seconds",
+        )
+
+    # Only the terminal fragment reruns on the timer, not the whole page
+    st.fragment(run_every=2 if auto_refresh else None)(render_terminal_output)()
+
 
 def render_download_location() -> None:
     with st.expander("Download Location", expanded=False):
@@ -146,11 +163,8 @@ def render_torrent_section() -> None:
             if not uploaded_torrent:
                 st.warning("Please select a .torrent file first.")
             else:
-                os.makedirs(default_torrent_dir, exist_ok=True)
-                local_torrent_path = os.path.join(default_torrent_dir, uploaded_torrent.name)
                 try:
-                    with open(local_torrent_path, "wb") as f:
-                        f.write(uploaded_torrent.getbuffer())
+                    local_torrent_path = save_uploaded_torrent(uploaded_torrent, default_torrent_dir)
                 except Exception as e:
                     st.error(f"Failed to save uploaded .torrent file: {e}")
                 else:
@@ -167,10 +181,8 @@ def render_torrent_section() -> None:
         with col_t_pause:
             if st.button("⏸️ Pause Torrent Activity", key="pause_torrent_downloads"):
                 try:
-                    import subprocess as _sp
-
-                    _sp.run(["pkill", "-STOP", "aria2c"], check=False)
-                    _sp.run(["pkill", "-STOP", "webtorrent"], check=False)
+                    control_torrents("pause")
+                    signal_processes(signal.SIGSTOP, names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                     st.session_state["torrent_paused"] = True
                     st.info("Requested pause of aria2c/webtorrent torrent activity.")
                 except Exception:
@@ -178,26 +190,18 @@ def render_torrent_section() -> None:
         with col_t_resume:
             if st.button("▶️ Resume Torrent Activity", key="resume_torrent_downloads"):
                 try:
-                    import subprocess as _sp
-
-                    _sp.run(["pkill", "-CONT", "aria2c"], check=False)
-                    _sp.run(["pkill", "-CONT", "webtorrent"], check=False)
+                    control_torrents("resume")
+                    signal_processes(signal.SIGCONT, names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                     st.session_state["torrent_paused"] = False
                     st.info("Requested resume of aria2c/webtorrent torrent activity.")
                 except Exception:
                     st.warning("Attempted to resume torrents, but an error occurred.")
         with col_t_stop:
             if st.button("⏹️ Stop Torrent Downloads", key="stop_torrent_downloads"):
-                st.session_state["stop_downloads"] = True
+                ensure_stop_event().set()
                 try:
-                    import subprocess as _sp, time as _t
-
-                    _sp.run(["pkill", "-TERM", "aria2c"], check=False)
-                    _t.sleep(0.2)
-                    _sp.run(["pkill", "-KILL", "aria2c"], check=False)
-                    _sp.run(["pkill", "-TERM", "webtorrent"], check=False)
-                    _t.sleep(0.2)
-                    _sp.run(["pkill", "-KILL", "webtorrent"], check=False)
+                    control_torrents("remove")
+                    terminate_processes(names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
                 except Exception:
                     pass
                 st.info(
@@ -206,22 +210,14 @@ def render_torrent_section() -> None:
                 )
 
         if st.button("🧹 Stop & Delete Torrent Data", key="stop_delete_torrent_data"):
-            st.session_state["stop_downloads"] = True
+            ensure_stop_event().set()
             try:
-                import subprocess as _sp, time as _t
-
-                _sp.run(["pkill", "-TERM", "aria2c"], check=False)
-                _t.sleep(0.2)
-                _sp.run(["pkill", "-KILL", "aria2c"], check=False)
-                _sp.run(["pkill", "-TERM", "webtorrent"], check=False)
-                _t.sleep(0.2)
-                _sp.run(["pkill", "-KILL", "webtorrent"], check=False)
+                control_torrents("remove")
+                terminate_processes(names=("webtorrent",), cmdline_patterns=(ARIA2_CLI_PATTERN,))
             except Exception:
                 pass
             if os.path.isdir(default_torrent_dir):
                 try:
-                    import shutil
-
                     shutil.rmtree(default_torrent_dir)
                     os.makedirs(default_torrent_dir, exist_ok=True)
                     st.success(
@@ -238,10 +234,7 @@ def render_torrent_section() -> None:
                 if not video_paths:
                     st.warning("No video files found in the torrent download folder yet.")
                 else:
-                    names = [os.path.relpath(p, default_torrent_dir) for p in video_paths]
-                    urls = [Path(os.path.abspath(p)).as_uri() for p in video_paths]
-                    from .streaming import stream_all_in_vlc  # lazy import to avoid cycles
-
+                    names, urls = local_playlist(video_paths, default_torrent_dir)
                     try:
                         stream_all_in_vlc(urls, names)
                         st.success(
@@ -256,11 +249,8 @@ def render_torrent_section() -> None:
             if torrent_url and is_torrent_link(torrent_url):
                 torrent_ref = torrent_url.strip()
             elif uploaded_torrent:
-                os.makedirs(default_torrent_dir, exist_ok=True)
-                local_torrent_path = os.path.join(default_torrent_dir, uploaded_torrent.name)
                 try:
-                    with open(local_torrent_path, "wb") as f:
-                        f.write(uploaded_torrent.getbuffer())
+                    local_torrent_path = save_uploaded_torrent(uploaded_torrent, default_torrent_dir)
                     torrent_ref = local_torrent_path
                 except Exception as e:
                     st.error(f"Failed to save uploaded .torrent file for streaming: {e}")
@@ -279,7 +269,7 @@ def main() -> None:
     render_header()
 
     if "file_status" not in st.session_state:
-        st.session_state["file_status"] = {}
+        st.session_state["file_status"] = StatusBoard()
     if "video_files" not in st.session_state:
         st.session_state["video_files"] = []
     if "selected_files" not in st.session_state: